@@ -19,13 +19,16 @@ from pathlib import Path
 from loguru import logger
 from requests_cache import CachedSession
 
+import namer.dupes
 import namer.metadataapi
 import namer.namer
 import namer.videohashes
 import namer.watchdog
 import namer.web
 from namer.configuration_utils import default_config
-from namer.models import db
+from namer.database import bind_database
+from namer.http import Http
+from namer.processbudget import ProcessBudget
 
 DESCRIPTION = (
     namer.namer.DESCRIPTION
@@ -39,6 +42,7 @@ DESCRIPTION = (
     'suggest' takes a file name as input and will output a suggested file name.
     'url' print url to namer web ui.
     'hash' takes a file name as input and will output a hashes in json format.
+    'dupes' prints groups of files in the namer database with similar phashes, or the files similar to a file.
     """
 )
 
@@ -67,10 +71,14 @@ def main():
         expire_time = timedelta(minutes=config.requests_cache_expire_minutes)
         config.cache_session = CachedSession(str(cache_file), backend='sqlite', expire_after=expire_time, ignored_parameters=['Authorization'])
 
+    # share one pool of kept alive connections between all requests, cached or not.
+    Http.configure(config.http_pool_size, config.http_max_retries, sessions=[config.cache_session] if config.cache_session else None)
+
+    # one limit on the ffmpeg processes run by all threads.
+    ProcessBudget.configure(config.ffmpeg_budget)
+
     if config.use_database:
-        db_file = config.database_path / 'namer_database.sqlite'
-        db.bind(provider='sqlite', filename=str(db_file), create_db=True)
-        db.generate_mapping(create_tables=True)
+        bind_database(config.database_path / 'namer_database.sqlite')
 
     arg1 = None if len(arg_list) == 0 else arg_list[0]
     if arg1 == 'watchdog':
@@ -83,6 +91,8 @@ def main():
         print(f'http://{config.host}:{config.port}{config.web_root}')
     elif arg1 == 'hash':
         namer.videohashes.main(arg_list[1:])
+    elif arg1 == 'dupes':
+        namer.dupes.main(arg_list[1:])
     elif arg1 in ['-h', 'help', None]:
         print(DESCRIPTION)
 
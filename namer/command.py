@@ -4,13 +4,20 @@ Tools for working with files and directories in namer.
 
 import argparse
 import gzip
+import heapq
+import math
 import os
 import shutil
 import sys
+import time
+from collections import Counter
+from contextlib import suppress
 from dataclasses import dataclass
 from pathlib import Path
 from platform import system
-from typing import Iterable, List, Optional, Sequence, Tuple
+from queue import Queue
+from threading import Lock
+from typing import Iterable, List, Optional, Sequence, Set, Tuple
 
 import jsonpickle
 from loguru import logger
@@ -18,6 +25,7 @@ from loguru import logger
 from namer.comparison_results import ComparisonResults, LookedUpFileInfo, SceneType
 from namer.configuration import NamerConfig
 from namer.configuration_utils import default_config
+from namer.database import QueueStage, remove_queued_command, set_queued_command_stage, write_queued_command
 from namer.ffmpeg import FFProbeResults
 from namer.fileinfo import FileInfo, parse_file_name
 
@@ -75,6 +83,133 @@ class Command:
         return str(self.target_movie_file.resolve())
 
 
+class CommandQueue(Queue):
+    """
+    A priority queue of commands (or None, to stop a worker, after all queued commands) that keeps count of the
+    targets of the queued commands, so checking if a target is queued takes constant time, however long the queue is.
+
+    Commands are ordered by the time they were queued plus a delay, commands from the web ui (renames of failed files)
+    get ahead of all automatic ones queued in the last day, and automatic commands are delayed by the size of their
+    file, so small files are processed before large ones.   As the delay is fixed when a command is queued large files
+    age, and are not starved by a steady stream of small ones.
+    """
+
+    manual_delay: float = -24 * 60 * 60
+    """
+    Delay of commands from the web ui, in seconds.
+    """
+
+    seconds_per_gb: float = 5 * 60
+    """
+    Delay of automatic commands per GB of their file, up to max_size_delay seconds.
+    """
+
+    max_size_delay: float = 60 * 60
+
+    __target_counts: Counter
+    __sequence: int
+    __in_flight: int
+    __busy_since: float
+    __completed_at: float
+    __seconds_per_item: Optional[float]
+
+    def _init(self, maxsize: int):
+        self.queue: List[Tuple[float, int, Optional[str], Optional[Command]]] = []  # type: ignore
+        self.__target_counts = Counter()
+        self.__sequence = 0
+        self.__in_flight = 0
+        self.__busy_since = 0.0
+        self.__completed_at = 0.0
+        self.__seconds_per_item = None
+
+    def _qsize(self) -> int:
+        return len(self.queue)
+
+    def _put(self, item: Optional[Command]):
+        self.__put(item, item.get_command_target() if item is not None else None)
+
+    def __put(self, item: Optional[Command], target: Optional[str]):
+        self.__sequence += 1
+        heapq.heappush(self.queue, (self.__priority(item), self.__sequence, target, item))
+        if target is not None:
+            self.__target_counts[target] += 1
+
+    def __priority(self, command: Optional[Command]) -> float:
+        if command is None:
+            return math.inf
+
+        if not command.is_auto:
+            return time.time() + self.manual_delay
+
+        size = 0
+        with suppress(OSError):
+            size = command.target_movie_file.stat().st_size
+
+        return time.time() + min(size / (1024 * 1024 * 1024) * self.seconds_per_gb, self.max_size_delay)
+
+    def _get(self) -> Optional[Command]:
+        _, _, target, item = heapq.heappop(self.queue)
+        if target is not None:
+            self.__target_counts[target] -= 1
+            if self.__target_counts[target] <= 0:
+                del self.__target_counts[target]
+
+        if item is not None:
+            if self.__in_flight == 0:
+                self.__busy_since = time.monotonic()
+
+            self.__in_flight += 1
+
+        return item
+
+    def task_done(self):
+        super().task_done()
+
+        # the time between completions while commands are processed is the time a queued command waits per position.
+        with self.mutex:
+            if self.__in_flight > 0:
+                now = time.monotonic()
+                seconds = now - max(self.__busy_since, self.__completed_at)
+                self.__seconds_per_item = seconds if self.__seconds_per_item is None else 0.8 * self.__seconds_per_item + 0.2 * seconds
+                self.__completed_at = now
+                self.__in_flight -= 1
+
+    def is_queued(self, command: Command) -> bool:
+        with self.mutex:
+            return command.get_command_target() in self.__target_counts
+
+    def put_unique(self, command: Command) -> bool:
+        """
+        Adds a command unless a command for the same target is queued, blocks while the queue is full.
+        Returns if the command was added.
+        """
+        target = command.get_command_target()
+        with self.not_full:
+            if self.maxsize > 0:
+                while self._qsize() >= self.maxsize:
+                    self.not_full.wait()
+
+            if target in self.__target_counts:
+                return False
+
+            self.__put(command, target)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+        return True
+
+    def items(self, limit: Optional[int] = None) -> List[Tuple[Command, Optional[float]]]:
+        """
+        Queued commands in the order they will be processed, each with an estimate of the seconds until it is done,
+        None until a command was processed.
+        """
+        with self.mutex:
+            entries = heapq.nsmallest(limit, self.queue) if limit is not None else sorted(self.queue)
+            seconds_per_item = self.__seconds_per_item
+
+        commands = [entry[3] for entry in entries if entry[3] is not None]
+        return [(command, (position + 1) * seconds_per_item if seconds_per_item is not None else None) for position, command in enumerate(commands)]
+
 def move_command_files(target: Optional[Command], new_target: Path, is_auto: bool = True) -> Optional[Command]:
     if not target:
         return None
@@ -98,6 +233,27 @@ def move_command_files(target: Optional[Command], new_target: Path, is_auto: boo
     return output
 
 
+def move_command_to_work_dir(command: Optional[Command], is_auto: bool = True) -> Optional[Command]:
+    """
+    Moves the files of a command to the work dir, recording the command in the database's work queue before moving,
+    so a command is resumed, or rolled back, when namer stopped while moving or processing it.
+    """
+    if not command:
+        return None
+
+    source = command.target_directory if command.target_directory and command.input_file == command.target_directory else command.target_movie_file
+    work_path = command.config.work_dir / source.name
+    write_queued_command(work_path, source, QueueStage.MOVING, is_auto, command.tpdb_id)
+
+    working_command = move_command_files(command, command.config.work_dir, is_auto=is_auto)
+    if working_command:
+        set_queued_command_stage(work_path, QueueStage.QUEUED)
+    else:
+        remove_queued_command(work_path)
+
+    return working_command
+
+
 def write_log_file(movie_file: Optional[Path], match_attempts: Optional[ComparisonResults], namer_config: NamerConfig) -> Optional[Path]:
     """
     Given porndb scene results sorted by how closely they match a file,  write the contents
@@ -200,6 +356,34 @@ def selected_best_movie(movies: List[str], config: NamerConfig) -> Optional[Path
     return None
 
 
+_final_location_lock = Lock()
+_reserved_final_locations: Set[Path] = set()
+"""
+Final locations selected by a worker that is still moving a movie there, guarded by _final_location_lock.
+"""
+
+_duplicates_lock = Lock()
+
+
+def __final_location_duplicates(target_dir: Path, name_template: str, new_metadata: LookedUpFileInfo, config: NamerConfig) -> List[str]:
+    """
+    The existing movies at all (n) infixed variants of a final location, skipping those still being moved to.
+    """
+    infix = 0
+    movies: List[str] = []
+    while True:
+        movie_name = (target_dir / new_metadata.new_file_name(name_template, config, f'({infix})')).resolve()
+        infix += 1
+        if movie_name.exists():
+            movies.append(str(movie_name))
+        else:
+            with _final_location_lock:
+                if movie_name not in _reserved_final_locations:
+                    break
+
+    return movies
+
+
 def move_to_final_location(command: Command, new_metadata: LookedUpFileInfo) -> Command:
     """
     Moves a file or directory to its final location after verifying there is no collision.
@@ -221,45 +405,59 @@ def move_to_final_location(command: Command, new_metadata: LookedUpFileInfo) ->
         name_template = get_new_relative_path_name_template_by_type(command.config, new_metadata.type)
         target_dir = command.config.dest_dir
 
-    infix = 0
-    # Find non-conflicting movie name.
-    movies: List[str] = []
-    while True:
-        relative_path = Path(new_metadata.new_file_name(name_template, command.config, f'({infix})'))
-        movie_name = target_dir / relative_path
-        movie_name = movie_name.resolve()
-        infix += 1
-        if not movie_name.exists():
-            break
+    # Concurrent workers must not select the same non-conflicting name, the selected name is reserved until the movie is moved there.
+    with _final_location_lock:
+        infix = 0
+        # Find non-conflicting movie name.
+        while True:
+            relative_path = Path(new_metadata.new_file_name(name_template, command.config, f'({infix})'))
+            movie_name = target_dir / relative_path
+            movie_name = movie_name.resolve()
+            infix += 1
+            if movie_name in _reserved_final_locations:
+                continue
 
-        movies.append(str(movie_name))
-        if command.target_movie_file.samefile(movie_name):
-            break
+            if not movie_name.exists():
+                break
 
-    # Create the new dir if needed and move the movie file to it.
-    movie_name.parent.mkdir(exist_ok=True, parents=True)
-    shutil.move(command.target_movie_file, movie_name)
-    movies.append(str(movie_name))
+            if command.target_movie_file.samefile(movie_name):
+                break
+
+        _reserved_final_locations.add(movie_name)
+
+    try:
+        # Create the new dir if needed and move the movie file to it.
+        movie_name.parent.mkdir(exist_ok=True, parents=True)
+        shutil.move(command.target_movie_file, movie_name)
+    finally:
+        with _final_location_lock:
+            _reserved_final_locations.discard(movie_name)
 
     # Now that all files are in place we'll see if we intend to minimize duplicates
-    if not command.config.preserve_duplicates and movies:
-        # Now set to the final name location since -- will grab the metadata requested
-        # incase it has been updated.
-        relative_path = Path(new_metadata.new_file_name(name_template, command.config, '(0)'))
-
-        # no move best match to primary movie location.
-        final_location = (target_dir / relative_path).resolve()
-        selected_movie = selected_best_movie(movies, command.config)
-        if selected_movie:
-            movies.remove(str(selected_movie))
-            if str(selected_movie.resolve()) != str(final_location.resolve()):
-                movies.remove(str(final_location))
-                final_location.unlink()
-                shutil.move(selected_movie, final_location)
-                movie_name = final_location
-
-            for movie in movies:
-                Path(movie).unlink()
+    if not command.config.preserve_duplicates:
+        # Only workers minimizing duplicates wait on each other, and only when there are duplicates to compare.
+        with _duplicates_lock:
+            movies = __final_location_duplicates(target_dir, name_template, new_metadata, command.config)
+            if len(movies) > 1:
+                # Now set to the final name location since -- will grab the metadata requested
+                # incase it has been updated.
+                relative_path = Path(new_metadata.new_file_name(name_template, command.config, '(0)'))
+
+                # no move best match to primary movie location.
+                final_location = (target_dir / relative_path).resolve()
+                selected_movie = selected_best_movie(movies, command.config)
+                if selected_movie:
+                    movies.remove(str(selected_movie))
+                    if str(selected_movie.resolve()) != str(final_location.resolve()):
+                        if str(final_location) in movies:
+                            movies.remove(str(final_location))
+                            final_location.unlink()
+
+                        shutil.move(selected_movie, final_location)
+                        movie_name = final_location
+
+                    for movie in movies:
+                        Path(movie).unlink()
 
     containing_dir: Optional[Path] = None
     if relative_path.parts:
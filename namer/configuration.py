@@ -265,6 +265,22 @@ class NamerConfig:
     Amount of minutes that http request would be in cache
     """
 
+    max_lookup_workers: int = 4
+    """
+    Max amount of porndb queries made concurrently, shared by all files being matched.   The queries of a single
+    step of a search (with and without phash) are made at the same time, set to 1 to query one at a time.
+    """
+
+    http_pool_size: int = 10
+    """
+    Max amount of connections kept open, and reused, to a single host.   Requests over that wait for a free connection.
+    """
+
+    http_max_retries: int = 3
+    """
+    Amount of times requests failing with a 429 (rate limited) or 5xx status are retried, with an increasing backoff.
+    """
+
     plex_hack: bool = False
     """
     Should plex movies have S##E## stripped out of movie names (to allow videos to be visible in plex)
@@ -348,11 +364,29 @@ class NamerConfig:
     Max ffmpeg processes for alternative PHASH generation, empty for auto select
     """
 
+    ffmpeg_budget: Optional[int] = None
+    """
+    Limits the ffmpeg, ffprobe and phash processes running at once, each takes a weight from the budget while it runs,
+    a probe 1, a screenshot 2, a single pass of screenshots or a remux 4 and a stash phash 8.   Empty for twice the
+    number of cores.
+    """
+
     use_gpu: Optional[bool] = False
     """
     Use gpu for alternative PHASH generation
     """
 
+    single_pass_phash: bool = False
+    """
+    Extract all frames for alternative PHASH generation with one ffmpeg process, instead of one process per frame
+    """
+
+    phash_processes: int = 0
+    """
+    Number of processes alternative PHASH generation runs in, shared by all files hashed at once, 0 to hash in the
+    calling thread.   max_ffmpeg_workers is split between the processes.
+    """
+
     mark_collected: bool = False
     """
     Mark any matched video as "collected" in TPDB, allowing TPDB to keep track of videos you have collected.
@@ -421,6 +455,17 @@ class NamerConfig:
     Extra time to sleep in seconds to allow all information to be copied in dir
     """
 
+    settle_time: int = 2
+    """
+    Seconds the size and modification time of a new file in the watch_dir must stay the same before it's processed
+    """
+
+    check_open_files: bool = True
+    """
+    Wait for new files in the watch_dir to be closed by other processes, on linux those writing them, before they are
+    processed.   Files copied over network shares, or from outside a docker container, can't be seen open.
+    """
+
     queue_limit: int = 0
     """
     Maximum amount of items in queue
@@ -431,6 +476,24 @@ class NamerConfig:
     Sleep time between queue size check
     """
 
+    queue_workers: int = 1
+    """
+    Number of worker threads processing the queue concurrently, two workers never process the same target file
+    """
+
+    pipeline_processing: bool = False
+    """
+    Process queued files in overlapping stages, hashing of one file, looking up another in the porndb and moving/tagging
+    a third all happen at the same time.   Each stage runs queue_workers threads.
+    """
+
+    native_observer: bool = False
+    """
+    Watch the watch_dir with the operating system's file events (inotify on linux) instead of polling it, which uses no
+    cpu or io while idle.   Falls back to polling if a test file created on startup is not seen, as happens on network
+    shares and docker bind mounts.
+    """
+
     web: bool = True
     """
     Run webserver while running watchdog
@@ -574,6 +637,9 @@ class NamerConfig:
                 'database_path': str(self.database_path),
                 'use_requests_cache': self.use_requests_cache,
                 'requests_cache_expire_minutes': self.requests_cache_expire_minutes,
+                'max_lookup_workers': self.max_lookup_workers,
+                'http_pool_size': self.http_pool_size,
+                'http_max_retries': self.http_max_retries,
                 'override_tpdb_address': self.override_tpdb_address,
                 'plex_hack': self.plex_hack,
                 'convert_container_to': self.convert_container_to,
@@ -584,7 +650,10 @@ class NamerConfig:
                 'send_phash': self.send_phash,
                 'use_alt_phash_tool': self.use_alt_phash_tool,
                 'max_ffmpeg_workers': self.max_ffmpeg_workers,
+                'ffmpeg_budget': self.ffmpeg_budget,
                 'use_gpu': self.use_gpu,
+                'single_pass_phash': self.single_pass_phash,
+                'phash_processes': self.phash_processes,
                 # "require_match_phash_top": self.require_match_phash_top,
                 # "send_phash_of_matches_to_tpdb": self.send_phash_of_matches_to_tpdb,
             },
@@ -619,8 +688,13 @@ class NamerConfig:
                 'dest_dir': str(self.dest_dir),
                 'retry_time': self.retry_time,
                 'extra_sleep_time': self.extra_sleep_time,
+                'settle_time': self.settle_time,
+                'check_open_files': self.check_open_files,
                 'queue_limit': self.queue_limit,
                 'queue_sleep_time': self.queue_sleep_time,
+                'queue_workers': self.queue_workers,
+                'pipeline_processing': self.pipeline_processing,
+                'native_observer': self.native_observer,
                 'web': self.web,
                 'port': self.port,
                 'host': self.host,
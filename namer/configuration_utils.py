@@ -269,6 +269,9 @@ field_info: Dict[str, Tuple[str, Optional[Callable[[Optional[str]], Any]], Optio
     'database_path': ('namer', to_path, from_path),
     'use_requests_cache': ('namer', to_bool, from_bool),
     'requests_cache_expire_minutes': ('namer', to_int, from_int),
+    'max_lookup_workers': ('namer', to_int, from_int),
+    'http_pool_size': ('namer', to_int, from_int),
+    'http_max_retries': ('namer', to_int, from_int),
     'override_tpdb_address': ('namer', None, None),
     'plex_hack': ('namer', to_bool, from_bool),
     'path_cleanup': ('namer', to_bool, from_bool),
@@ -276,7 +279,10 @@ field_info: Dict[str, Tuple[str, Optional[Callable[[Optional[str]], Any]], Optio
     'send_phash': ('Phash', to_bool, from_bool),
     'use_alt_phash_tool': ('Phash', to_bool, from_bool),
     'max_ffmpeg_workers': ('Phash', to_int, from_int),
+    'ffmpeg_budget': ('Phash', to_int, from_int),
     'use_gpu': ('Phash', to_bool, from_bool),
+    'single_pass_phash': ('Phash', to_bool, from_bool),
+    'phash_processes': ('Phash', to_int, from_int),
     'mark_collected': ('metadata', to_bool, from_bool),
     'use_disambiguation': ('metadata', to_bool, from_bool),
     'write_nfo': ('metadata', to_bool, from_bool),
@@ -293,8 +299,13 @@ field_info: Dict[str, Tuple[str, Optional[Callable[[Optional[str]], Any]], Optio
     'ignored_dir_regex': ('watchdog', to_pattern, from_pattern),
     'del_other_files': ('watchdog', to_bool, from_bool),
     'extra_sleep_time': ('watchdog', to_int, from_int),
+    'settle_time': ('watchdog', to_int, from_int),
+    'check_open_files': ('watchdog', to_bool, from_bool),
     'queue_limit': ('watchdog', to_int, from_int),
     'queue_sleep_time': ('watchdog', to_int, from_int),
+    'queue_workers': ('watchdog', to_int, from_int),
+    'pipeline_processing': ('watchdog', to_bool, from_bool),
+    'native_observer': ('watchdog', to_bool, from_bool),
     'new_relative_path_name': ('watchdog', None, None),
     'new_relative_path_name_scene': ('watchdog', None, None),
     'new_relative_path_name_movie': ('watchdog', None, None),
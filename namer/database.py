@@ -1,10 +1,20 @@
+import atexit
+import os
+import sqlite3
+from contextlib import closing, suppress
+from enum import Enum
 from pathlib import Path
-from typing import Optional
+from threading import Condition, Lock, Thread
+from time import monotonic
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 
-from pony.orm import commit, db_session
+from loguru import logger
+from pony.orm import commit, db_session, flush, select
 
-from namer.models import File
+from namer.models import db, File, QueuedCommand
 from namer.videophash import PerceptualHash
+from namer.videophash.imagehash import hex_to_hash
+from namer.videophash.phashindex import PhashIndex
 
 abbreviations = {
     '18og': '18OnlyGirls',
@@ -296,24 +306,357 @@ abbreviations = {
 re_cleanup = [r'[0-9]{3,4}x[0-9]{3,4}', r'[0-9]{2}fps', r'[0-9]{3,4}p', r'[0-9]k', r'XXX.*', r'\[WEBDL-.*']
 
 
+__file_columns = {
+    'file_device': 'INTEGER',
+    'file_inode': 'INTEGER',
+    'ffprobe': 'TEXT',
+}
+"""
+Columns added to the File table since it was first created, see migrate_database.
+"""
+
+
+class WALConnection(sqlite3.Connection):
+    """
+    Connections to the namer database use the write ahead log, so readers (like the web ui) are not blocked by a writer,
+    and only sync to disk at checkpoints, not at every commit.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.execute('PRAGMA journal_mode = WAL')
+        self.execute('PRAGMA synchronous = NORMAL')
+        self.execute('PRAGMA temp_store = MEMORY')
+
+
+class WriteBehind:
+    """
+    Write-behind buffer of file rows, values queued for the same file (by device, inode, size and modification time,
+    as they were when queued) are merged, and written by a background thread in one transaction once max_size files
+    are pending, max_delay seconds after the oldest pending write, or when flushed.
+    """
+
+    __pending: Dict[Tuple[int, int, int, float], Tuple[str, os.stat_result, Dict[str, Any]]]
+    __pending_since: float
+
+    def __init__(self, write: Callable[[Iterable[Tuple[str, os.stat_result, Dict[str, Any]]]], None], max_size: int = 100, max_delay: float = 5.0):
+        self.__write = write
+        self.__max_size = max_size
+        self.__max_delay = max_delay
+        self.__pending = {}
+        self.__pending_since = 0
+        self.__condition = Condition()
+        self.__flush_lock = Lock()
+        self.__thread: Optional[Thread] = None
+
+    @staticmethod
+    def key(item_stats: os.stat_result) -> Tuple[int, int, int, float]:
+        return item_stats.st_dev, item_stats.st_ino, item_stats.st_size, item_stats.st_mtime
+
+    def put(self, working_item: Path, **values: Any):
+        item_stats = working_item.stat()
+        with self.__condition:
+            if not self.__pending:
+                self.__pending_since = monotonic()
+
+            _, _, pending_values = self.__pending.get(self.key(item_stats), (None, None, {}))
+            self.__pending[self.key(item_stats)] = (working_item.name, item_stats, {**pending_values, **values})
+
+            if not self.__thread:
+                self.__thread = Thread(target=self.__run, name='namer-database-writer', daemon=True)
+                self.__thread.start()
+
+            self.__condition.notify()
+
+    def flush(self, item_stats: Optional[os.stat_result] = None):
+        """
+        Writes all pending rows, or with item_stats only if that file has a pending row, returns once they are written.
+        """
+        with self.__flush_lock:
+            with self.__condition:
+                if item_stats and self.key(item_stats) not in self.__pending:
+                    return
+
+                pending, self.__pending = self.__pending, {}
+
+            if pending:
+                try:
+                    self.__write(pending.values())
+                except Exception as error:
+                    logger.error('Could not write {} files to the namer database: {}', len(pending), error)
+
+    def __run(self):
+        while True:
+            with self.__condition:
+                while not self.__pending:
+                    self.__condition.wait()
+
+                while self.__pending and len(self.__pending) < self.__max_size:
+                    remaining = self.__pending_since + self.__max_delay - monotonic()
+                    if remaining <= 0:
+                        break
+
+                    self.__condition.wait(remaining)
+
+            self.flush()
+
+
+def bind_database(db_file: Path):
+    """
+    Binds the namer database to db_file, creating it if needed, and migrating it if it was created by an older namer.
+    """
+    migrate_database(db_file)
+    db.bind(provider='sqlite', filename=str(db_file), create_db=True, factory=WALConnection, timeout=30)
+    db.generate_mapping(create_tables=True)
+
+
+def migrate_database(db_file: Path):
+    """
+    Pony creates missing tables, but not missing columns or indexes of existing tables, those are added here.
+    """
+    if not db_file.is_file():
+        return
+
+    with closing(sqlite3.connect(db_file)) as connection, connection:
+        columns = {row[1] for row in connection.execute('PRAGMA table_info("File")')}
+        if not columns:
+            return
+
+        for column, column_type in __file_columns.items():
+            if column not in columns:
+                logger.info(f'Adding column {column} to the namer database')
+                connection.execute(f'ALTER TABLE "File" ADD COLUMN "{column}" {column_type}')
+
+        # tables created by pony hold the unique key as a constraint.
+        table_sql = connection.execute('SELECT "sql" FROM "sqlite_master" WHERE "type" = \'table\' AND "name" = \'File\'').fetchone()[0]
+        if 'unq_file__file_device_file_inode' not in table_sql:
+            __remove_duplicate_files(connection)
+            connection.execute('DROP INDEX IF EXISTS "idx_file__file_device_file_inode"')
+            connection.execute('CREATE UNIQUE INDEX IF NOT EXISTS "unq_file__file_device_file_inode" ON "File" ("file_device", "file_inode")')
+
+        connection.execute('CREATE INDEX IF NOT EXISTS "idx_file__file_name_file_size" ON "File" ("file_name", "file_size")')
+        connection.execute('CREATE INDEX IF NOT EXISTS "idx_file__phash" ON "File" ("phash")')
+        connection.execute('CREATE INDEX IF NOT EXISTS "idx_file__oshash" ON "File" ("oshash")')
+
+
+def __remove_duplicate_files(connection: sqlite3.Connection):
+    """
+    Keeps the newest row of each device and inode, with the values of older rows of the same file version (size and modification time) it is missing.
+    """
+    duplicates = connection.execute('SELECT "file_device", "file_inode" FROM "File" WHERE "file_inode" IS NOT NULL GROUP BY "file_device", "file_inode" HAVING COUNT(*) > 1').fetchall()
+    if duplicates:
+        logger.info(f'Removing duplicate rows of {len(duplicates)} files from the namer database')
+
+    for file_device, file_inode in duplicates:
+        rows = connection.execute('SELECT "id", "file_size", "file_time", "duration", "phash", "oshash", "ffprobe" FROM "File" WHERE "file_device" = ? AND "file_inode" = ? ORDER BY "id" DESC', (file_device, file_inode)).fetchall()
+        newest, older = rows[0], rows[1:]
+        values = list(newest[3:])
+        for row in older:
+            if row[1:3] == newest[1:3]:
+                values = [value if value else older_value for value, older_value in zip(values, row[3:])]
+
+        connection.execute('UPDATE "File" SET "duration" = ?, "phash" = ?, "oshash" = ?, "ffprobe" = ? WHERE "id" = ?', (*values, newest[0]))
+        connection.executemany('DELETE FROM "File" WHERE "id" = ?', [(row[0],) for row in older])
+
+
 def safe_write_file_to_database(working_item: Path, phash: PerceptualHash):
     if not search_file_in_database(working_item):
         write_file_to_database(working_item, phash)
 
 
-@db_session
 def write_file_to_database(working_item: Path, phash: PerceptualHash):
-    item_stats = working_item.stat()
-    item_phash = str(phash.phash) if phash else None
-    item_oshash = phash.oshash if phash else None
+    """
+    Queues the hashes of a file to be written with other files in one transaction, see WriteBehind.
+    """
+    __write_behind.put(working_item, **__hash_values(phash))
+
+
+def flush_database():
+    """
+    Writes all queued files to the database.
+    """
+    __write_behind.flush()
+
+
+def write_files_to_database(items: Iterable[Tuple[Path, PerceptualHash]]):
+    """
+    Writes the hashes of many files in one transaction.
+    """
+    __write_files((working_item.name, working_item.stat(), __hash_values(phash)) for working_item, phash in items)
+
+
+def __hash_values(phash: PerceptualHash) -> Dict[str, Any]:
+    return {
+        'duration': phash.duration if phash else None,
+        'phash': str(phash.phash) if phash else None,
+        'oshash': phash.oshash if phash else None,
+    }
+
+
+@db_session(retry=3)
+def __write_files(items: Iterable[Tuple[str, os.stat_result, Dict[str, Any]]]):
+    """
+    Upserts files, by device and inode (or name, size and modification time for files stored by an older namer),
+    another namer process writing the same file at once fails the transaction, which is retried.
+    """
+    for file_name, item_stats, values in items:
+        # the file may already be stored, with only some of its values.
+        search_result = __search_file(file_name, item_stats)
+        if search_result:
+            search_result.set(**values)
+            continue
+
+        # or an older version of it, the values of which no longer apply.
+        search_result = File.get(file_device=item_stats.st_dev, file_inode=item_stats.st_ino)
+        if search_result:
+            search_result.set(file_name=file_name, file_size=item_stats.st_size, file_time=item_stats.st_mtime, **{**__empty_values, **values})
+        else:
+            File(file_name=file_name, file_size=item_stats.st_size, file_time=item_stats.st_mtime, file_device=item_stats.st_dev, file_inode=item_stats.st_ino, **values)
 
-    File(file_name=working_item.name, file_size=item_stats.st_size, file_time=item_stats.st_mtime, duration=phash.duration, phash=item_phash, oshash=item_oshash)
     commit()
 
 
-@db_session
+__empty_values = {'duration': None, 'phash': '', 'oshash': '', 'ffprobe': ''}
+
+
+__write_behind = WriteBehind(__write_files)
+atexit.register(flush_database)
+
+
 def search_file_in_database(working_item: Path) -> Optional[File]:
+    """
+    Files are found by device, inode, size and modification time, so renamed and moved files are still found.
+    Files stored by an older namer, or copied to another file system, are found by name, size and modification
+    time, and are updated with their current device, inode and name.
+    """
     item_stats = working_item.stat()
+    __write_behind.flush(item_stats)
+
+    return __search_file(working_item.name, item_stats)
+
+
+@db_session
+def __search_file(file_name: str, item_stats: os.stat_result) -> Optional[File]:
+    search_result = File.select(file_device=item_stats.st_dev, file_inode=item_stats.st_ino, file_size=item_stats.st_size, file_time=item_stats.st_mtime).first()
+    if not search_result:
+        search_result = File.select(file_name=file_name, file_size=item_stats.st_size, file_time=item_stats.st_mtime).first()
+
+    if search_result and (search_result.file_device, search_result.file_inode, search_result.file_name) != (item_stats.st_dev, item_stats.st_ino, file_name):
+        # a row for an older version of the file, its device and inode are unique.
+        if (search_result.file_device, search_result.file_inode) != (item_stats.st_dev, item_stats.st_ino):
+            stale = File.get(file_device=item_stats.st_dev, file_inode=item_stats.st_ino)
+            if stale:
+                stale.delete()
+                flush()
+
+        search_result.set(file_device=item_stats.st_dev, file_inode=item_stats.st_ino, file_name=file_name)
+        commit()
 
-    search_result = File.get(file_name=working_item.name, file_size=item_stats.st_size, file_time=item_stats.st_mtime)
     return search_result
+
+
+def is_database_bound() -> bool:
+    return db.provider is not None
+
+
+def get_ffprobe_from_database(working_item: Path) -> Optional[str]:
+    """
+    The stored ffprobe results of a file, see FFProbeResults.loads, None if not stored or the database is not used.
+    """
+    if not is_database_bound():
+        return None
+
+    search_result = search_file_in_database(working_item)
+    return search_result.ffprobe if search_result and search_result.ffprobe else None
+
+
+def write_ffprobe_to_database(working_item: Path, ffprobe: str):
+    """
+    Queues the ffprobe results of a file to be written, does nothing if the database is not used.
+    """
+    if not is_database_bound():
+        return
+
+    __write_behind.put(working_item, ffprobe=ffprobe)
+
+
+def get_phash_index() -> PhashIndex[str]:
+    """
+    Index of the phashes of every file in the database, by file name.
+    """
+    flush_database()
+
+    return __read_phash_index()
+
+
+@db_session
+def __read_phash_index() -> PhashIndex[str]:
+    index: PhashIndex[str] = PhashIndex()
+    for file_name, phash in select((file.file_name, file.phash) for file in File if file.phash):
+        with suppress(ValueError):
+            index.add(hex_to_hash(phash), file_name)
+
+    return index
+
+
+class QueueStage(str, Enum):
+    MOVING = 'moving'
+    QUEUED = 'queued'
+    PROCESSING = 'processing'
+
+
+def write_queued_command(work_path: Path, source_path: Path, stage: QueueStage, is_auto: bool = True, tpdb_id: Optional[str] = None):
+    """
+    Records the stage of a command in the work queue, so it is resumed after namer restarts, does nothing if the
+    database is not used.   Written right away, queued commands must survive a crash.
+    """
+    if is_database_bound():
+        __write_queued_command(str(work_path), str(source_path), stage.value, is_auto, tpdb_id or '')
+
+
+@db_session(retry=3)
+def __write_queued_command(work_path: str, source_path: str, stage: str, is_auto: bool, tpdb_id: str):
+    queued = QueuedCommand.get(work_path=work_path)
+    if queued:
+        queued.set(source_path=source_path, stage=stage, is_auto=is_auto, tpdb_id=tpdb_id)
+    else:
+        QueuedCommand(work_path=work_path, source_path=source_path, stage=stage, is_auto=is_auto, tpdb_id=tpdb_id)
+
+
+def set_queued_command_stage(work_path: Path, stage: QueueStage):
+    if is_database_bound():
+        __set_queued_command_stage(str(work_path), stage.value)
+
+
+@db_session(retry=3)
+def __set_queued_command_stage(work_path: str, stage: str):
+    queued = QueuedCommand.get(work_path=work_path)
+    if queued:
+        queued.stage = stage
+
+
+def remove_queued_command(work_path: Path):
+    if is_database_bound():
+        __remove_queued_command(str(work_path))
+
+
+@db_session(retry=3)
+def __remove_queued_command(work_path: str):
+    QueuedCommand.select(work_path=work_path).delete(bulk=True)
+
+
+def get_queued_commands(work_dir: Path) -> List[QueuedCommand]:
+    """
+    Commands recorded in the work queue for files in work_dir, in the order they were queued, empty if the
+    database is not used.
+    """
+    if not is_database_bound():
+        return []
+
+    return __get_queued_commands(str(work_dir))
+
+
+@db_session
+def __get_queued_commands(work_dir: str) -> List[QueuedCommand]:
+    queued = select(queued for queued in QueuedCommand).order_by(QueuedCommand.id)
+    return [item for item in queued if Path(item.work_path).parent == Path(work_dir)]
@@ -0,0 +1,127 @@
+"""
+Cached, persisted stat results of a directory tree, so scanning a large watch dir (on a slow NAS) only touches the
+directories that changed since the last scan, or since namer last ran.
+"""
+
+import os
+import time
+from contextlib import suppress
+from pathlib import Path
+from stat import S_ISDIR
+from threading import Lock
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import orjson
+from loguru import logger
+from watchdog.utils.dirsnapshot import DirectorySnapshot
+
+
+class DirEntry:
+    """
+    The part of os.DirEntry used by watchdog's DirectorySnapshot.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+class DirSnapshot:
+    """
+    Directories are listed again only when their modification time changed, files in unchanged directories keep their
+    cached stat results, directories themselves are always stat'ed, since changes to a subdirectory do not change its
+    parent.   Creating, moving or deleting a file changes its directory's modification time, growing a file does not,
+    so only new, moved and deleted files are seen, which is all the watchdog acts on.
+
+    Its stat and listdir functions are used by watchdog's polling observer, and by the startup scan of the watch dir.
+    """
+
+    __racy_seconds: float = 2
+    """
+    A listing taken this close to its directory's modification time may miss a file created in the same (coarse)
+    file system timestamp tick, it is listed again on the next scan.
+    """
+
+    __root: str
+    __listings: Dict[str, Tuple[float, bool, List[str]]]
+    __stats: Dict[str, os.stat_result]
+    __unchanged: Set[str]
+
+    def __init__(self, root: Path):
+        self.__root = str(root)
+        self.__listings = {}
+        self.__stats = {}
+        self.__unchanged = set()
+        self.__lock = Lock()
+
+    def stat(self, path: str) -> os.stat_result:
+        with self.__lock:
+            cached = self.__stats.get(path)
+            if cached and not S_ISDIR(cached.st_mode) and os.path.dirname(path) in self.__unchanged:
+                return cached
+
+        stat = os.stat(path)
+        with self.__lock:
+            self.__stats[path] = stat
+
+        return stat
+
+    def listdir(self, path: Optional[str]) -> Iterator[DirEntry]:
+        path = path if path else '.'
+        with self.__lock:
+            stat, listing = self.__stats.get(path), self.__listings.get(path)
+            if stat and listing and listing[0] == stat.st_mtime and not listing[1]:
+                self.__unchanged.add(path)
+                return iter([DirEntry(name) for name in listing[2]])
+
+            self.__unchanged.discard(path)
+
+        listed_at = time.time()
+        names = [entry.name for entry in os.scandir(path)]
+        with self.__lock:
+            if stat:
+                self.__listings[path] = (stat.st_mtime, listed_at - stat.st_mtime < self.__racy_seconds, names)
+
+            # forget files that are gone.
+            for name in set(listing[2] if listing else []) - set(names):
+                self.__stats.pop(os.path.join(path, name), None)
+                self.__listings.pop(os.path.join(path, name), None)
+
+        return iter([DirEntry(name) for name in names])
+
+    def snapshot(self) -> DirectorySnapshot:
+        """
+        A watchdog snapshot of the whole tree, using (and updating) the cached results.
+        """
+        return DirectorySnapshot(self.__root, stat=self.stat, listdir=self.listdir)
+
+    def save(self, file: Path):
+        with self.__lock:
+            data = {
+                'root': self.__root,
+                'listings': self.__listings,
+                'stats': {path: [*stat[:7], stat.st_atime, stat.st_mtime, stat.st_ctime] for path, stat in self.__stats.items()},
+            }
+
+        file.parent.mkdir(parents=True, exist_ok=True)
+        temp_file = file.with_name(file.name + '.tmp')
+        temp_file.write_bytes(orjson.dumps(data))
+        os.replace(temp_file, file)
+
+    def load(self, file: Path):
+        """
+        Loads a saved snapshot of the same root, an unreadable snapshot is ignored, and the tree is scanned again.
+        """
+        if not file.is_file():
+            return
+
+        with suppress(Exception):
+            data = orjson.loads(file.read_bytes())
+            if data['root'] != self.__root:
+                return
+
+            stats = {path: os.stat_result(stat[:7] + [int(stamp) for stamp in stat[7:]], {'st_atime': stat[7], 'st_mtime': stat[8], 'st_ctime': stat[9]}) for path, stat in data['stats'].items()}
+            listings = {path: (listing[0], listing[1], listing[2]) for path, listing in data['listings'].items()}
+            with self.__lock:
+                self.__stats, self.__listings = stats, listings
+
+            logger.info('Loaded a snapshot of {} entries of {}', len(stats), self.__root)
@@ -0,0 +1,48 @@
+import argparse
+import sys
+from pathlib import Path
+from typing import List
+
+from loguru import logger
+
+from namer.configuration_utils import default_config
+from namer.database import bind_database, get_phash_index, is_database_bound
+from namer.namer import calculate_phash
+
+
+def main(args_list: List[str]):
+    """
+    Command line interface to find files with similar phashes in the namer database.
+    """
+    description = """
+    Command line interface to find files with similar phashes in the namer database, all groups of duplicates,
+    or the files close to one file.
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('-c', '--configfile', help='override location for a configuration file.', type=Path)
+    parser.add_argument('-f', '--file', help='File we want to find duplicates of.', type=Path)
+    parser.add_argument('-d', '--distance', help='max hamming distance between phashes of duplicates, defaults to 4.', type=int, default=4)
+    parser.add_argument('-v', '--verbose', help='verbose, print logs', action='store_true')
+    args = parser.parse_args(args=args_list)
+
+    config = default_config(args.configfile.resolve() if args.configfile else None)
+    if args.verbose:
+        level = 'DEBUG' if config.debug else 'INFO'
+        logger.add(sys.stdout, format=config.console_format, level=level, diagnose=config.diagnose_errors)
+
+    if not config.use_database:
+        print('use_database must be enabled to find duplicates')
+        return
+
+    if not is_database_bound():
+        bind_database(config.database_path / 'namer_database.sqlite')
+
+    index = get_phash_index()
+    if args.file:
+        file_hash = calculate_phash(args.file.resolve(), config)
+        if file_hash:
+            for distance, file_name in index.search(file_hash.phash, args.distance):
+                print(f'{distance}\t{file_name}')
+    else:
+        for group in index.duplicates(args.distance):
+            print('\n'.join(group) + '\n')
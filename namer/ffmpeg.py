@@ -24,6 +24,9 @@ from loguru import logger
 from pathvalidate import ValidationError
 from PIL import Image
 
+from namer.database import get_ffprobe_from_database, write_ffprobe_to_database
+from namer.mp4boxes import set_default_track
+from namer.processbudget import ProcessBudget, ProcessKind
 from namer.videophash.videophashstash import StashVideoPerceptualHash
 
 
@@ -119,6 +122,35 @@ class FFProbeResults:
 
         return None
 
+    def dumps(self) -> str:
+        """
+        Compact json of the results, only values ffprobe returned are included, see FFProbeResults.loads
+        """
+        data = {
+            'streams': [vars(stream) for stream in self.__results],
+            'format': vars(self.__format),
+        }
+
+        return orjson.dumps(data).decode('UTF-8')
+
+    @staticmethod
+    def loads(data: str) -> 'FFProbeResults':
+        json = orjson.loads(data)
+
+        streams = []
+        for json_stream in json['streams']:
+            stream = FFProbeStream()
+            for key, value in json_stream.items():
+                setattr(stream, key, value)
+
+            streams.append(stream)
+
+        probe_format = FFProbeFormat()
+        for key, value in json['format'].items():
+            setattr(probe_format, key, value)
+
+        return FFProbeResults(streams, probe_format)
+
 
 class FFMpeg:
     __local_dir: Optional[Path] = None
@@ -159,9 +191,14 @@ class FFMpeg:
         Get the typed results of probing a video stream with ffprobe.
         """
 
+        stored = get_ffprobe_from_database(file)
+        if stored:
+            logger.info(f'Getting ffprobe from db for file "{file}"')
+            return FFProbeResults.loads(stored)
+
         logger.info(f'ffprobe file "{file}"')
         ffprobe_out = None
-        with suppress(Exception):
+        with suppress(Exception), ProcessBudget.run(ProcessKind.PROBE):
             ffprobe_out = ffmpeg.probe(file, self.__ffprobe_cmd)
 
         if not ffprobe_out:
@@ -203,7 +240,10 @@ class FFMpeg:
             probe_format.size = int(ffprobe_out['format']['size'])
             probe_format.tags = ffprobe_out['format']['tags'] if 'tags' in ffprobe_out['format'] else {}
 
-        return FFProbeResults(output, probe_format)
+        results = FFProbeResults(output, probe_format)
+        write_ffprobe_to_database(file, results.dumps())
+
+        return results
 
     def get_audio_stream_for_lang(self, file: Path, language: str) -> int:
         """
@@ -227,7 +267,7 @@ class FFMpeg:
         """
         Returns true if the file had to be edited to have a default audio stream equal to the desired language,
         mostly a concern for apple players (Quicktime/Apple TV/etc.)
-        Copies, and potentially updates the default audio stream of a video file.
+        Updates the default audio stream of a video file in place, or copies it with ffmpeg if that isn't possible.
         """
 
         random = ''.join(choices(population=string.ascii_uppercase + string.digits, k=10))
@@ -236,20 +276,28 @@ class FFMpeg:
 
         stream = self.get_audio_stream_for_lang(mp4_file, language) if language else None
         if stream and stream >= 0:
-            # fmt: off
-            process = (
-                ffmpeg
-                .input(mp4_file)
-                .output(str(work_file), **{
-                    'map': 0,  # copy all stream
-                    'disposition:a': 'none',  # mark all audio streams as not default
-                    f'disposition:a:{stream}': 'default',  # mark this audio stream as default
-                    'c': 'copy'  # don't re-encode anything.
-                })
-                .run_async(quiet=True, cmd=self.__ffmpeg_cmd)
-            )
+            # the flags of the audio tracks are flipped in place, see get_audio_stream_for_lang for the index,
+            # the file is only copied by ffmpeg if that fails.
+            if set_default_track(mp4_file, stream + 1, b'soun'):
+                logger.info('Updated default audio stream of {} in place', mp4_file)
+                return True
+
+            with ProcessBudget.run(ProcessKind.REMUX):
+                # fmt: off
+                process = (
+                    ffmpeg
+                    .input(mp4_file)
+                    .output(str(work_file), **{
+                        'map': 0,  # copy all stream
+                        'disposition:a': 'none',  # mark all audio streams as not default
+                        f'disposition:a:{stream}': 'default',  # mark this audio stream as default
+                        'c': 'copy'  # don't re-encode anything.
+                    })
+                    .run_async(quiet=True, cmd=self.__ffmpeg_cmd)
+                )
+
+                stdout, stderr = process.communicate()
 
-            stdout, stderr = process.communicate()
             stdout, stderr = (stdout.decode('UTF-8') if isinstance(stdout, bytes) else stdout), (stderr.decode('UTF-8') if isinstance(stderr, bytes) else stderr)
             success = process.returncode == 0
             if not success:
@@ -279,15 +327,17 @@ class FFMpeg:
         Attempt to fix corrupt mp4 files.
         """
         logger.info('Attempt to fix damaged mp4 file: {}', mp4_file)
-        # fmt: off
-        process = (
-            ffmpeg
-            .input(mp4_file)
-            .output(str(output), c='copy')
-            .overwrite_output()
-            .run_async(quiet=True, cmd=self.__ffmpeg_cmd)
-        )
-        stdout, stderr = process.communicate()
+        with ProcessBudget.run(ProcessKind.REMUX):
+            # fmt: off
+            process = (
+                ffmpeg
+                .input(mp4_file)
+                .output(str(output), c='copy')
+                .overwrite_output()
+                .run_async(quiet=True, cmd=self.__ffmpeg_cmd)
+            )
+            stdout, stderr = process.communicate()
+
         stdout, stderr = (stdout.decode('UTF-8') if isinstance(stdout, bytes) else stdout), (stderr.decode('UTF-8') if isinstance(stderr, bytes) else stderr)
         success = process.returncode == 0
         if not success:
@@ -298,24 +348,69 @@ class FFMpeg:
             mp4_file.unlink()
         return success
 
-    def extract_screenshot(self, file: Path, screenshot_time: float, screenshot_width: int = -1, use_gpu: bool = False) -> Image.Image:
+    def extract_screenshot(self, file: Path, screenshot_time: float, screenshot_width: int = -1, use_gpu: bool = False, raw: bool = False) -> Image.Image:
+        """
+        Extract a frame as an image, with raw (requires a screenshot_width) the frame is piped back as rgb24 pixels
+        instead of an apng, skipping encoding and decoding it, the height is what is left of the frame's size.
+        """
         input_args = {}
         if use_gpu:
             input_args['hwaccel'] = 'auto'
 
-        # fmt: off
-        out, _ = (
-            ffmpeg
-            .input(file, ss=screenshot_time, **input_args)
-            .filter('scale', screenshot_width, -2)
-            .output('pipe:', vframes=1, format='apng')
-            .run(quiet=True, capture_stdout=True, cmd=self.__ffmpeg_cmd)
-        )
-        out = BytesIO(out)
-        image = Image.open(out)
+        raw = raw and screenshot_width > 0
+        output_args = {'format': 'rawvideo', 'pix_fmt': 'rgb24'} if raw else {'format': 'apng'}
+
+        with ProcessBudget.run(ProcessKind.SCREENSHOT):
+            # fmt: off
+            out, _ = (
+                ffmpeg
+                .input(file, ss=screenshot_time, **input_args)
+                .filter('scale', screenshot_width, -2)
+                .output('pipe:', vframes=1, **output_args)
+                .run(quiet=True, capture_stdout=True, cmd=self.__ffmpeg_cmd)
+            )
+
+        if raw:
+            if not out:
+                raise ValueError(f'no frame at {screenshot_time} in file "{file}"')
+
+            size = screenshot_width, len(out) // (screenshot_width * 3)
+            image = Image.frombuffer('RGB', size, out, 'raw', 'RGB', 0, 1)
+        else:
+            image = Image.open(BytesIO(out))
 
         return image
 
+    def extract_screenshots(self, file: Path, screenshot_times: List[float], screenshot_width: int = -1, use_gpu: bool = False) -> List[Image.Image]:
+        """
+        Extract a screenshot for each of the times with a single ffmpeg process, one seeking input per time,
+        the frames are piped back as uncompressed ppm images (a short header and raw RGB pixels).
+        """
+        input_args = {}
+        if use_gpu:
+            input_args['hwaccel'] = 'auto'
+
+        streams = [ffmpeg.input(file, ss=screenshot_time, **input_args).video.filter('scale', screenshot_width, -2).filter('trim', end_frame=1) for screenshot_time in screenshot_times]
+
+        with ProcessBudget.run(ProcessKind.SCREENSHOTS):
+            # fmt: off
+            out, _ = (
+                ffmpeg
+                .concat(*streams, v=1, a=0)
+                .output('pipe:', format='image2pipe', vcodec='ppm', fps_mode='passthrough')
+                .run(quiet=True, capture_stdout=True, cmd=self.__ffmpeg_cmd)
+            )
+
+        images = []
+        position = 0
+        while header := re.match(rb'P6\s(\d+)\s(\d+)\s255\s', out[position:position + 32]):
+            size = int(header.group(1)), int(header.group(2))
+            start = position + header.end()
+            position = start + size[0] * size[1] * 3
+            images.append(Image.frombytes('RGB', size, out[start:position]))
+
+        return images
+
     def ffmpeg_version(self) -> Dict:
         return self.__ffmpeg_version(self.__local_dir)
 
@@ -1,10 +1,18 @@
+import os
 from enum import Enum
 from io import BytesIO
-from typing import Optional
+from pathlib import Path
+from threading import Lock
+from typing import List, Optional
 
 import requests
 from loguru import logger
+from requests.adapters import HTTPAdapter
 from requests_cache import CachedSession
+from urllib3.util import Retry
+
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
 
 
 class RequestType(Enum):
@@ -14,6 +22,53 @@ class RequestType(Enum):
 
 
 class Http:
+    __session: Optional[requests.Session] = None
+    __session_lock = Lock()
+
+    @staticmethod
+    def configure(pool_size: int = 10, max_retries: int = 3, backoff_factor: float = 0.5, sessions: Optional[List[requests.Session]] = None):
+        """
+        Sets up the shared connection pool used for all requests, connections are kept alive and reused.
+        At most pool_size connections are opened to a single host, requests over that wait for a free connection.
+        Idempotent requests (GET, HEAD, ...) failing with a 429 or 5xx status, or a read error, are retried max_retries
+        times, backing off exponentially and honoring Retry-After headers.   Failures to connect are retried for all
+        methods, including POST, as the request was never sent.   Any sessions passed, like the CachedSession, are
+        mounted on the same pool.
+        """
+        session = Http.__new_session(pool_size, max_retries, backoff_factor, sessions)
+        with Http.__session_lock:
+            old_session, Http.__session = Http.__session, session
+
+        if old_session:
+            old_session.close()
+
+    @staticmethod
+    def session() -> requests.Session:
+        """
+        The shared session, created with default settings if Http.configure was not called.
+        """
+        with Http.__session_lock:
+            if not Http.__session:
+                Http.__session = Http.__new_session()
+
+            return Http.__session
+
+    @staticmethod
+    def __new_session(pool_size: int = 10, max_retries: int = 3, backoff_factor: float = 0.5, sessions: Optional[List[requests.Session]] = None) -> requests.Session:
+        pool_size = max(pool_size, 1)
+        max_retries = max(max_retries, 0)
+        retries = Retry(total=max_retries, connect=max_retries, read=max_retries, status=max_retries, allowed_methods=Retry.DEFAULT_ALLOWED_METHODS, backoff_factor=backoff_factor, status_forcelist=[429, 500, 502, 503, 504], raise_on_status=False)
+
+        # pool_maxsize is the limit of connections per host, pool_connections (the amount of hosts with a pool kept) is left at its default.
+        adapter = HTTPAdapter(pool_maxsize=pool_size, max_retries=retries, pool_block=True)
+
+        session = requests.Session()
+        for mounted in [session, *(sessions or [])]:
+            mounted.mount('http://', adapter)
+            mounted.mount('https://', adapter)
+
+        return session
+
     @staticmethod
     def request(method: RequestType, url, **kwargs):
         logger.debug(f'Requesting {method.value} "{url}"')
@@ -22,7 +77,7 @@ class Http:
             del kwargs['cache_session']
 
         if kwargs.get('stream', False) or not isinstance(cache_session, CachedSession):
-            return requests.request(method.value, url, **kwargs)
+            return Http.session().request(method.value, url, **kwargs)
         else:
             return cache_session.request(method.value, url, **kwargs)
 
@@ -41,12 +96,46 @@ class Http:
     @staticmethod
     def download_file(url: str, **kwargs) -> Optional[BytesIO]:
         kwargs.setdefault('stream', True)
-        http = Http.get(url, **kwargs)
-        if http.ok:
-            f = BytesIO()
-            for data in http.iter_content(1024):
-                f.write(data)
+        with Http.get(url, **kwargs) as http:
+            if http.ok:
+                f = BytesIO()
+                for data in http.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    f.write(data)
 
-            return f
+                return f
 
         return None
+
+    @staticmethod
+    def download_to_file(url: str, file: Path, **kwargs) -> bool:
+        """
+        Streams a download to a .part file next to file, which is renamed to file once the download completed.
+        Should a .part file be left by an interrupted download, the download is resumed with a http Range request,
+        if the server doesn't support ranges the download restarts.
+        """
+        part_file = file.parent / (file.name + '.part')
+        headers = dict(kwargs.pop('headers', None) or {})
+        kwargs['stream'] = True
+
+        offset = part_file.stat().st_size if part_file.exists() else 0
+        if offset:
+            logger.debug(f'Resuming download of "{url}" at {offset} bytes')
+            headers['Range'] = f'bytes={offset}-'
+
+        with Http.get(url, headers=headers, **kwargs) as http:
+            if offset and http.status_code == 416:
+                # the part file is not part of what is served (anymore), start over.
+                http.close()
+                part_file.unlink()
+                return Http.download_to_file(url, file, headers={k: v for k, v in headers.items() if k != 'Range'}, **kwargs)
+
+            if not http.ok:
+                return False
+
+            resumed = bool(offset) and http.status_code == 206 and http.headers.get('Content-Range', '').startswith(f'bytes {offset}-')
+            with open(part_file, 'ab' if resumed else 'wb') as f:
+                for data in http.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    f.write(data)
+
+        os.replace(part_file, file)
+        return True
@@ -8,10 +8,12 @@ import itertools
 import random
 import re
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import suppress
 from functools import lru_cache
 from pathlib import Path
-from typing import Any, List, Optional, Tuple
+from threading import Lock
+from typing import Any, List, Optional, Set, Tuple
 from urllib.parse import quote
 
 import orjson
@@ -132,7 +134,7 @@ def __evaluate_match(name_parts: Optional[FileInfo], looked_up: LookedUpFileInfo
                         scene_hash = imagehash.hex_to_hash(item.hash)
 
                     if scene_hash:
-                        distance = phash.phash - imagehash.hex_to_hash(item.hash)
+                        distance = phash.phash - scene_hash
                         duration = item.duration == phash.duration if item.duration else True
                         hashes_distances.append((distance, duration))
 
@@ -150,49 +152,98 @@ def __evaluate_match(name_parts: Optional[FileInfo], looked_up: LookedUpFileInfo
     )
 
 
-def __update_results(results: List[ComparisonResult], name_parts: Optional[FileInfo], namer_config: NamerConfig, skip_date: bool = False, skip_name: bool = False, scene_type: SceneType = SceneType.SCENE, phash: Optional[PerceptualHash] = None):
-    if not results or not results[0].is_match():
-        for match_attempt in __get_metadataapi_net_fileinfo(name_parts, namer_config, skip_date, skip_name, scene_type=scene_type, phash=phash):
-            if match_attempt.uuid not in [res.looked_up.uuid for res in results]:
-                result: ComparisonResult = __evaluate_match(name_parts, match_attempt, namer_config, phash)
-                results.append(result)
+def __lookup_steps(name_parts: Optional[FileInfo], namer_config: NamerConfig, scene_type: SceneType, phash: Optional[PerceptualHash] = None) -> List[Tuple[List[str], Optional[PerceptualHash]]]:
+    """
+    The ladder of queries used to find a match, in order.   Each step is a list of urls to request
+    and the phash results of those urls are evaluated with.
+    """
+    variants: List[Tuple[bool, bool, Optional[PerceptualHash]]] = [(False, False, phash), (False, True, phash)]
 
-        for match_attempt in __get_metadataapi_net_fileinfo(name_parts, namer_config, skip_date, skip_name, scene_type=scene_type):
-            if match_attempt.uuid not in [res.looked_up.uuid for res in results]:
-                result: ComparisonResult = __evaluate_match(name_parts, match_attempt, namer_config, phash)
-                results.append(result)
+    if phash:
+        variants.extend([(False, False, None), (False, True, None)])
 
-        results = sorted(results, key=__match_weight, reverse=True)
+    if name_parts and name_parts.date:
+        variants.extend([(True, False, None), (True, True, None)])
 
-    return results
+    steps = []
+    for skip_date, skip_name, step_phash in variants:
+        release_date = name_parts.date if name_parts and not skip_date else None
+        name = name_parts.name if name_parts and not skip_name else None
+        site = name_parts.site if name_parts else None
+
+        urls = []
+        for query_phash in [step_phash, None]:
+            url = __build_url(namer_config, site, release_date, name, scene_type=scene_type, phash=query_phash)
+            if url and url not in urls:
+                urls.append(url)
+
+        steps.append((urls, step_phash))
+
+    return steps
+
+
+__lookup_executor: Optional[Tuple[int, ThreadPoolExecutor]] = None
+__lookup_executor_lock = Lock()
+
+
+def __get_lookup_executor(workers: int) -> Optional[ThreadPoolExecutor]:
+    """
+    The executor shared by all lookups to request the urls of a step concurrently, None if requests are made one at a time.
+    """
+    global __lookup_executor
+    if workers <= 1:
+        return None
+
+    with __lookup_executor_lock:
+        if not __lookup_executor or __lookup_executor[0] != workers:
+            if __lookup_executor:
+                __lookup_executor[1].shutdown(wait=False)
+
+            __lookup_executor = (workers, ThreadPoolExecutor(max_workers=workers, thread_name_prefix='namer-lookup'))
+
+        return __lookup_executor[1]
 
 
 def __metadata_api_lookup_type(results: List[ComparisonResult], name_parts: Optional[FileInfo], namer_config: NamerConfig, scene_type: SceneType, phash: Optional[PerceptualHash] = None) -> List[ComparisonResult]:
-    results = __update_results(results, name_parts, namer_config, scene_type=scene_type, phash=phash)
-    results = __update_results(results, name_parts, namer_config, skip_name=True, scene_type=scene_type, phash=phash)
+    """
+    Walks the ladder of queries until a match is found, the urls of a step are requested concurrently.
+    A url is requested once, and the urls of a step are only requested if the earlier steps found no match.
+    """
+    executor = __get_lookup_executor(namer_config.max_lookup_workers)
+    requested: Set[str] = set()
+    for step_urls, step_phash in __lookup_steps(name_parts, namer_config, scene_type, phash):
+        if results and results[0].is_match():
+            break
+
+        urls = [url for url in step_urls if url not in requested]
+        requested.update(urls)
+        if executor and len(urls) > 1:
+            responses = list(executor.map(lambda url: __get_metadataapi_net_info(url, name_parts, namer_config), urls))
+        else:
+            responses = [__get_metadataapi_net_info(url, name_parts, namer_config) for url in urls]
 
-    if phash:
-        results = __update_results(results, name_parts, namer_config, scene_type=scene_type)
-        results = __update_results(results, name_parts, namer_config, skip_name=True, scene_type=scene_type)
+        for file_infos in responses:
+            for match_attempt in file_infos if file_infos else []:
+                if match_attempt.uuid not in [res.looked_up.uuid for res in results]:
+                    result: ComparisonResult = __evaluate_match(name_parts, match_attempt, namer_config, step_phash)
+                    results.append(result)
 
-    if name_parts and name_parts.date:
-        results = __update_results(results, name_parts, namer_config, skip_date=True, scene_type=scene_type)
-        results = __update_results(results, name_parts, namer_config, skip_date=True, skip_name=True, scene_type=scene_type)
+        results = sorted(results, key=__match_weight, reverse=True)
 
     return results
 
 
-def __metadata_api_lookup(name_parts: FileInfo, namer_config: NamerConfig, phash: Optional[PerceptualHash] = None) -> List[ComparisonResult]:
+def __metadata_api_lookup(name_parts: Optional[FileInfo], namer_config: NamerConfig, phash: Optional[PerceptualHash] = None) -> List[ComparisonResult]:
     scene_type: SceneType = SceneType.SCENE
-    if name_parts.site:  # noqa: SIM102
+    if name_parts and name_parts.site:  # noqa: SIM102
         if name_parts.site.strip().lower() in namer_config.movie_data_preferred:
             scene_type = SceneType.MOVIE
 
     results: List[ComparisonResult] = []
-    results: List[ComparisonResult] = __metadata_api_lookup_type(results, name_parts, namer_config, scene_type, phash)
-    if not results or not results[0].is_match():
+    results = __metadata_api_lookup_type(results, name_parts, namer_config, scene_type, phash)
+    if name_parts and (not results or not results[0].is_match()):
         scene_type = SceneType.MOVIE if scene_type == SceneType.SCENE else SceneType.SCENE
-        results: List[ComparisonResult] = __metadata_api_lookup_type(results, name_parts, namer_config, scene_type, phash)
+        results = __metadata_api_lookup_type(results, name_parts, namer_config, scene_type, phash)
 
     return results
 
@@ -256,11 +307,7 @@ def download_file(url: str, file: Path, config: NamerConfig) -> bool:
     if 'theporndb.net' in url:
         headers['Authorization'] = f'Bearer {config.porndb_token}'
 
-    http_file = Http.download_file(url, headers=headers)
-    if http_file:
-        file.write_bytes(http_file.getbuffer().tobytes())
-
-    return bool(http_file)
+    return Http.download_to_file(url, file, headers=headers)
 
 
 @logger.catch
@@ -495,20 +542,6 @@ def __get_metadataapi_net_info(url: str, name_parts: Optional[FileInfo], namer_c
     return file_infos
 
 
-def __get_metadataapi_net_fileinfo(name_parts: Optional[FileInfo], namer_config: NamerConfig, skip_date: bool, skip_name: bool, scene_type: SceneType = SceneType.SCENE, phash: Optional[PerceptualHash] = None) -> List[LookedUpFileInfo]:
-    if namer_config or phash:
-        release_date = name_parts.date if name_parts and not skip_date else None
-        name = name_parts.name if name_parts and not skip_name else None
-        site = name_parts.site if name_parts else None
-
-        url = __build_url(namer_config, site, release_date, name, scene_type=scene_type, phash=phash)
-        if url:
-            file_infos = __get_metadataapi_net_info(url, name_parts, namer_config)
-            return file_infos
-
-    return []
-
-
 @logger.catch
 def get_site_name(site_id: str, namer_config: NamerConfig) -> Optional[str]:
     site = None
@@ -538,11 +571,7 @@ def match(file_name_parts: Optional[FileInfo], namer_config: NamerConfig, phash:
     Give parsed file name parts, and a porndb token, returns a sorted list of possible matches.
     Matches will appear first.
     """
-    results: List[ComparisonResult] = []
-    if not file_name_parts:
-        results = __metadata_api_lookup_type(results, None, namer_config, SceneType.SCENE, phash)
-    else:
-        results: List[ComparisonResult] = __metadata_api_lookup(file_name_parts, namer_config, phash)
+    results: List[ComparisonResult] = __metadata_api_lookup(file_name_parts, namer_config, phash)
 
     comparison_results = sorted(results, key=__match_weight, reverse=True)
 
@@ -1,4 +1,5 @@
 from .base import db
 from .file import File
+from .queued_command import QueuedCommand
 
-__all__ = ['db', 'File']
+__all__ = ['db', 'File', 'QueuedCommand']
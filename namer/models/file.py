@@ -1,4 +1,4 @@
-from pony.orm import Optional, PrimaryKey, Required
+from pony.orm import composite_index, composite_key, Optional, PrimaryKey, Required
 
 from namer.models import db
 
@@ -10,6 +10,15 @@ class File(db.Entity):
     file_size = Required(int, size=64)
     file_time = Required(float)
 
+    file_device = Optional(int, size=64)
+    file_inode = Optional(int, size=64)
+
     duration = Optional(int)
-    phash = Optional(str)
-    oshash = Optional(str)
+    phash = Optional(str, index=True)
+    oshash = Optional(str, index=True)
+    ffprobe = Optional(str)
+
+    # a device and inode identify one file at a time, files found by name are indexed by name and size
+    # since pony can not index the float file_time.
+    composite_key(file_device, file_inode)
+    composite_index(file_name, file_size)
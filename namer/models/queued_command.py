@@ -0,0 +1,15 @@
+from pony.orm import Optional, PrimaryKey, Required
+
+from namer.models import db
+
+
+class QueuedCommand(db.Entity):
+    id = PrimaryKey(int, auto=True)
+
+    # the file or directory in the work dir, and where it was moved from.
+    work_path = Required(str, unique=True)
+    source_path = Required(str)
+
+    stage = Required(str)
+    is_auto = Required(bool)
+    tpdb_id = Optional(str)
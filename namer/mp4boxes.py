@@ -0,0 +1,94 @@
+"""
+Edits of mp4 boxes (atoms) that don't change their size, so they are written in place, without copying the file.
+"""
+
+import struct
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Tuple
+
+from loguru import logger
+
+# a box as (type, start, header size, end)
+Box = Tuple[bytes, int, int, int]
+
+TKHD_FLAG_ENABLED = 0x000001
+
+
+def __boxes(mp4: BinaryIO, start: int, end: int) -> Iterator[Box]:
+    position = start
+    while position + 8 <= end:
+        mp4.seek(position)
+        size, box_type = struct.unpack('>I4s', mp4.read(8))
+        header_size = 8
+        if size == 1:
+            size = struct.unpack('>Q', mp4.read(8))[0]
+            header_size = 16
+        elif size == 0:
+            size = end - position
+
+        if size < header_size or position + size > end:
+            raise ValueError(f'invalid {box_type!r} box at {position}')
+
+        yield box_type, position, header_size, position + size
+        position += size
+
+
+def __children(mp4: BinaryIO, box: Box) -> Dict[bytes, Box]:
+    _, start, header_size, end = box
+    children: Dict[bytes, Box] = {}
+    for child in __boxes(mp4, start + header_size, end):
+        children.setdefault(child[0], child)
+
+    return children
+
+
+def set_default_track(file: Path, track_index: int, handler_type: bytes = b'soun') -> bool:
+    """
+    Marks the track at track_index (the index of its stream in ffprobe) as the enabled, default, track of its
+    handler_type, and all other tracks of that type as not enabled, by flipping a bit of their tkhd boxes.   ffmpeg
+    reads the enabled flag as the default disposition, and writes it for default streams.
+
+    Returns False, without changing the file, if it isn't an mp4 with such a track.
+    """
+    try:
+        with open(file, 'r+b') as mp4:
+            end = mp4.seek(0, 2)
+            moov = next((box for box in __boxes(mp4, 0, end) if box[0] == b'moov'), None)
+            if not moov:
+                return False
+
+            # (offset of the tkhd flags, flags, handler type) of each track.
+            tracks: List[Tuple[int, int, bytes]] = []
+            for trak in __boxes(mp4, moov[1] + moov[2], moov[3]):
+                if trak[0] != b'trak':
+                    continue
+
+                children = __children(mp4, trak)
+                tkhd, mdia = children.get(b'tkhd'), children.get(b'mdia')
+                hdlr = __children(mp4, mdia).get(b'hdlr') if mdia else None
+                if not tkhd or not hdlr:
+                    return False
+
+                # full boxes start with a version byte and 3 bytes of flags, hdlr has 4 more bytes before its handler type.
+                mp4.seek(tkhd[1] + tkhd[2])
+                flags = int.from_bytes(mp4.read(4)[1:], 'big')
+                mp4.seek(hdlr[1] + hdlr[2] + 8)
+                tracks.append((tkhd[1] + tkhd[2] + 1, flags, mp4.read(4)))
+
+            if track_index >= len(tracks) or tracks[track_index][2] != handler_type:
+                return False
+
+            for idx, (offset, flags, handler) in enumerate(tracks):
+                if handler != handler_type:
+                    continue
+
+                new_flags = flags | TKHD_FLAG_ENABLED if idx == track_index else flags & ~TKHD_FLAG_ENABLED
+                if new_flags != flags:
+                    mp4.seek(offset)
+                    mp4.write(new_flags.to_bytes(3, 'big'))
+
+            return True
+    except (OSError, ValueError, struct.error) as error:
+        logger.warning('Could not read the tracks of {}: {}', file, error)
+
+    return False
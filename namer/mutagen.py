@@ -3,15 +3,22 @@ Updates mp4 files with metadata tags readable by Plex and Apple TV App.
 """
 
 from pathlib import Path
-from typing import Any, List, Optional
+from typing import Any, Callable, List, Optional
 
 from loguru import logger
+from mutagen import PaddingInfo
 from mutagen.mp4 import MP4, MP4Cover, MP4StreamInfoError
 
 from namer.comparison_results import LookedUpFileInfo
 from namer.configuration import NamerConfig
 from namer.ffmpeg import FFMpeg, FFProbeResults
 
+# padding left after the tags when they outgrow theirs, so later edits are written in place.
+RESERVED_PADDING = 64 * 1024
+
+# moving less data than this, that follows the tags, is cheap, as when the moov atom is at the end of the file.
+CHEAP_REWRITE_SIZE = 1024 * 1024
+
 
 def resolution_to_hdv_setting(resolution: Optional[int]) -> int:
     """
@@ -130,12 +137,34 @@ def update_mp4_file(mp4: Path, looked_up: LookedUpFileInfo, poster: Optional[Pat
         itunes_movie += '</dict></plist>'
         video['----:com.apple.iTunes:iTunMOVI'] = itunes_movie.encode('UTF-8', errors='ignore')
         add_poster(poster, video)
-        video.save()
+        video.save(padding=__padding(mp4))
         logger.info('Updated atom tags: {}', mp4)
     else:
         logger.warning('Can not update tags of a non-existent file: {}', mp4)
 
 
+def __padding(mp4: Path) -> Callable[[PaddingInfo], int]:
+    """
+    The padding to leave after the tags of mp4.   Tags fitting the existing padding keep all of it, so only the moov
+    atom is written, in place.   Otherwise all data after the tags is moved, which is cheap when the moov atom is at the
+    end of the file, and a full rewrite of the media data when it's before the mdat atom, so more padding is reserved.
+    """
+
+    def padding(info: PaddingInfo) -> int:
+        if info.padding >= 0:
+            return info.padding
+
+        if info.size <= CHEAP_REWRITE_SIZE:
+            logger.debug('Tags of {} outgrew their padding, moving {} bytes after them', mp4, info.size)
+            return info.get_default_padding()
+
+        reserved = max(RESERVED_PADDING, info.get_default_padding())
+        logger.info('Tags of {} outgrew their padding, rewriting {} bytes of media data after them, reserving {} bytes of padding for later edits', mp4, info.size, reserved)
+        return reserved
+
+    return padding
+
+
 def add_poster(poster, video):
     """
     Adds a poster to the mp4 metadata if available and correct format.
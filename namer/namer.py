@@ -30,6 +30,7 @@ from namer.moviexml import parse_movie_xml_file, write_nfo
 from namer.mutagen import update_mp4_file
 from namer.name_formatter import PartialFormatter
 from namer.videophash import PerceptualHash, return_perceptual_hash
+from namer.videophash.videophashpool import get_process_pool_vph
 
 DESCRIPTION = """
     Namer, the porndb local file renamer. It can be a command line tool to rename mp4/mkv/avi/mov/flv files and to embed tags in mp4s,
@@ -141,6 +142,33 @@ def get_local_metadata_if_requested(video_file: Path) -> Optional[LookedUpFileIn
     return None
 
 
+@dataclass(init=False, repr=False, eq=True, order=False, unsafe_hash=True, frozen=False)
+class ProcessingState:
+    """
+    The state of a command as it passes through the processing stages, see process_file.
+    """
+
+    command: Command
+    """
+    The command being processed.
+    """
+
+    phash: Optional[PerceptualHash] = None
+    """
+    Hashes calculated for the target movie file, if search_phash is enabled.
+    """
+
+    new_metadata: Optional[LookedUpFileInfo] = None
+    """
+    New metadata found for the file being processed.
+    """
+
+    search_results: Optional[ComparisonResults] = None
+    """
+    Results of matching the file against the porndb.
+    """
+
+
 def process_file(command: Command) -> Optional[Command]:
     """
     Bread and butter method.
@@ -157,99 +185,153 @@ def process_file(command: Command) -> Optional[Command]:
     of the dir if a dir was passed in.
 
     The file is then update based on the metadata from the porndb if a mp4.
+
+    Processing is split in the stages convert_and_hash, lookup_metadata and move_and_tag,
+    which may also be run concurrently for different files, see namer.pipeline.
     """
     logger.info('Processing: {}', command.input_file)
     if command.target_movie_file is not None:
-        phash: Optional[PerceptualHash] = None
-        new_metadata: Optional[LookedUpFileInfo] = None
-        search_results: ComparisonResults = ComparisonResults([], None)
-        # convert container type if requested.
-        if command.config.convert_container_to and command.target_movie_file.suffix != command.config.convert_container_to:
-            new_loc = command.target_movie_file.parent.joinpath(Path(command.target_movie_file.stem + '.' + command.config.convert_container_to))
-            if FFMpeg().convert(command.target_movie_file, new_loc):
-                command.target_movie_file = new_loc
-                if command.parsed_file:
-                    command.parsed_file.extension = command.config.convert_container_to
-        # Match to nfo files, if enabled and found.
-        if command.write_from_nfos:
-            new_metadata = get_local_metadata_if_requested(command.target_movie_file)
-            if new_metadata is not None:
-                new_metadata.original_parsed_filename = command.parsed_file
-            else:
-                logger.error('Could not process files: {}\nIn the file\'s name should start with a site, a date and end with an extension', command.input_file)
-        # elif new_metadata is None and command.stashdb_id is not None and command.ff_probe_results is not None:
-        #    phash = VideoPerceptualHash().get_phash(command.target_movie_file)
-        #    todo use phash
-        elif new_metadata is None and command.tpdb_id is not None and command.parsed_file is not None:
-            file_infos = get_complete_metadataapi_net_fileinfo(command.parsed_file, command.tpdb_id, command.config)
-            if file_infos is not None:
-                new_metadata = file_infos
-        elif new_metadata is None and ((command.parsed_file is not None and command.parsed_file.name is not None) or command.config.search_phash):
-            phash = calculate_phash(command.target_movie_file, command.config) if command.config.search_phash else None
-            if phash:
-                logger.info(f'Calculated hashes: {phash.to_dict()}')
-                command.parsed_file.hashes = phash
-
-            search_results = match(command.parsed_file, command.config, phash=phash)
-            if search_results:
-                matched = search_results.get_match()
-                if matched:
-                    new_metadata = matched.looked_up
-
-            if not command.target_movie_file:
-                logger.error(
-                    """
-                    Could not process file or directory: {}
-                    Likely attempted to use the directory's name as the name to parse.
-                    In general the dir or file's name should start with a site, a date and end with an extension
-                    Target video file in dir was: {}""",
-                    command.input_file,
-                    command.target_movie_file,
-                )
-
-        target_dir = command.target_directory if command.target_directory is not None else command.target_movie_file.parent
-        set_permissions(target_dir, command.config)
-        if new_metadata is not None:
-            if command.config.manual_mode and command.is_auto:
-                failed = move_command_files(command, command.config.failed_dir)
-                if failed is not None and search_results is not None and failed.config.write_namer_failed_log:
-                    write_log_file(failed.target_movie_file, search_results, failed.config)
-            else:
-                ffprobe_results = command.config.ffmpeg.ffprobe(command.target_movie_file)
-                if ffprobe_results:
-                    new_metadata.resolution = ffprobe_results.get_resolution()
-
-                    video = ffprobe_results.get_default_video_stream()
-                    new_metadata.video_codec = video.codec_name if video else None
-
-                    audio = ffprobe_results.get_default_audio_stream()
-                    new_metadata.audio_codec = audio.codec_name if audio else None
-
-                if command.config.send_phash:
-                    phash = phash if phash else calculate_phash(command.target_movie_file, command.config)
-                    if phash:
-                        command.parsed_file.hashes = phash
-
-                        scene_hash = SceneHash(str(phash.phash), HashType.PHASH, phash.duration)
-                        share_hash(new_metadata, scene_hash, command.config)
-
-                        scene_hash = SceneHash(phash.oshash, HashType.OSHASH, phash.duration)
-                        share_hash(new_metadata, scene_hash, command.config)
-
-                log_file = command.config.failed_dir / (command.input_file.stem + '_namer.json.gz')
-                if log_file.is_file():
-                    log_file.unlink()
-
-                target = move_to_final_location(command, new_metadata)
-                tag_in_place(target.target_movie_file, command.config, new_metadata, ffprobe_results)
-                add_extra_artifacts(target.target_movie_file, new_metadata, search_results, phash, command.config)
-                send_webhook_notification(target.target_movie_file, command.config)
-                logger.success('Done processing file: {}, moved to {}', command.target_movie_file, target.target_movie_file)
-                return target
-        elif command.inplace is False:
+        state = ProcessingState()
+        state.command = command
+
+        convert_and_hash(state)
+        lookup_metadata(state)
+        return move_and_tag(state)
+
+    return None
+
+
+def __will_match(command: Command) -> bool:
+    """
+    True if metadata for the command will be matched against the porndb, rather than read from .nfo files or a known tpdb id.
+    """
+    if command.write_from_nfos:
+        return False
+
+    if command.tpdb_id is not None and command.parsed_file is not None:
+        return False
+
+    return (command.parsed_file is not None and command.parsed_file.name is not None) or command.config.search_phash
+
+
+def convert_and_hash(state: ProcessingState) -> ProcessingState:
+    """
+    First (cpu bound) stage of processing, converts the container type if requested and calculates
+    the hashes needed to match the file.
+    """
+    command = state.command
+
+    # convert container type if requested.
+    if command.config.convert_container_to and command.target_movie_file.suffix != command.config.convert_container_to:
+        new_loc = command.target_movie_file.parent.joinpath(Path(command.target_movie_file.stem + '.' + command.config.convert_container_to))
+        if FFMpeg().convert(command.target_movie_file, new_loc):
+            command.target_movie_file = new_loc
+            if command.parsed_file:
+                command.parsed_file.extension = command.config.convert_container_to
+
+    if command.config.search_phash and __will_match(command):
+        state.phash = calculate_phash(command.target_movie_file, command.config)
+        if state.phash:
+            logger.info(f'Calculated hashes: {state.phash.to_dict()}')
+            command.parsed_file.hashes = state.phash
+
+    return state
+
+
+def lookup_metadata(state: ProcessingState) -> ProcessingState:
+    """
+    Second (network bound) stage of processing, finds new metadata for the file from .nfo files or the porndb.
+    """
+    command = state.command
+    state.search_results = ComparisonResults([], None)
+
+    # Match to nfo files, if enabled and found.
+    if command.write_from_nfos:
+        state.new_metadata = get_local_metadata_if_requested(command.target_movie_file)
+        if state.new_metadata is not None:
+            state.new_metadata.original_parsed_filename = command.parsed_file
+        else:
+            logger.error('Could not process files: {}\nIn the file\'s name should start with a site, a date and end with an extension', command.input_file)
+    # elif new_metadata is None and command.stashdb_id is not None and command.ff_probe_results is not None:
+    #    phash = VideoPerceptualHash().get_phash(command.target_movie_file)
+    #    todo use phash
+    elif command.tpdb_id is not None and command.parsed_file is not None:
+        file_infos = get_complete_metadataapi_net_fileinfo(command.parsed_file, command.tpdb_id, command.config)
+        if file_infos is not None:
+            state.new_metadata = file_infos
+    elif __will_match(command):
+        state.search_results = match(command.parsed_file, command.config, phash=state.phash)
+        if state.search_results:
+            matched = state.search_results.get_match()
+            if matched:
+                state.new_metadata = matched.looked_up
+
+        if not command.target_movie_file:
+            logger.error(
+                """
+                Could not process file or directory: {}
+                Likely attempted to use the directory's name as the name to parse.
+                In general the dir or file's name should start with a site, a date and end with an extension
+                Target video file in dir was: {}""",
+                command.input_file,
+                command.target_movie_file,
+            )
+
+    return state
+
+
+def move_and_tag(state: ProcessingState) -> Optional[Command]:
+    """
+    Last (disk bound) stage of processing, moves the file to its final location and tags it, or moves it to the failed dir.
+    """
+    command = state.command
+    phash = state.phash
+    new_metadata = state.new_metadata
+    search_results = state.search_results
+
+    target_dir = command.target_directory if command.target_directory is not None else command.target_movie_file.parent
+    set_permissions(target_dir, command.config)
+    if new_metadata is not None:
+        if command.config.manual_mode and command.is_auto:
             failed = move_command_files(command, command.config.failed_dir)
             if failed is not None and search_results is not None and failed.config.write_namer_failed_log:
                 write_log_file(failed.target_movie_file, search_results, failed.config)
+        else:
+            ffprobe_results = command.config.ffmpeg.ffprobe(command.target_movie_file)
+            if ffprobe_results:
+                new_metadata.resolution = ffprobe_results.get_resolution()
+
+                video = ffprobe_results.get_default_video_stream()
+                new_metadata.video_codec = video.codec_name if video else None
+
+                audio = ffprobe_results.get_default_audio_stream()
+                new_metadata.audio_codec = audio.codec_name if audio else None
+
+            if command.config.send_phash:
+                phash = phash if phash else calculate_phash(command.target_movie_file, command.config)
+                if phash:
+                    command.parsed_file.hashes = phash
+
+                    scene_hash = SceneHash(str(phash.phash), HashType.PHASH, phash.duration)
+                    share_hash(new_metadata, scene_hash, command.config)
+
+                    scene_hash = SceneHash(phash.oshash, HashType.OSHASH, phash.duration)
+                    share_hash(new_metadata, scene_hash, command.config)
+
+            log_file = command.config.failed_dir / (command.input_file.stem + '_namer.json.gz')
+            if log_file.is_file():
+                log_file.unlink()
+
+            target = move_to_final_location(command, new_metadata)
+            tag_in_place(target.target_movie_file, command.config, new_metadata, ffprobe_results)
+            add_extra_artifacts(target.target_movie_file, new_metadata, search_results, phash, command.config)
+            send_webhook_notification(target.target_movie_file, command.config)
+            logger.success('Done processing file: {}, moved to {}', command.target_movie_file, target.target_movie_file)
+            return target
+    elif command.inplace is False:
+        failed = move_command_files(command, command.config.failed_dir)
+        if failed is not None and search_results is not None and failed.config.write_namer_failed_log:
+            write_log_file(failed.target_movie_file, search_results, failed.config)
 
     return None
 
@@ -332,12 +414,15 @@ def check_arguments(file_to_process: Path, dir_to_process: Path, config_override
 def calculate_phash(file: Path, config: NamerConfig) -> Optional[PerceptualHash]:
     if config.use_database:
         search_result = search_file_in_database(file)
-        if search_result:
+        if search_result and search_result.phash:
             logger.info(f'Getting phash from db for file "{file}"')
             return return_perceptual_hash(search_result.duration, search_result.phash, search_result.oshash)
 
     vph = config.vph_alt if config.use_alt_phash_tool else config.vph
-    phash = vph.get_hashes(file, max_workers=config.max_ffmpeg_workers, use_gpu=config.use_gpu if config.use_gpu else False)
+    if config.use_alt_phash_tool and config.phash_processes > 0:
+        vph = get_process_pool_vph(config.ffmpeg, config.phash_processes)
+
+    phash = vph.get_hashes(file, max_workers=config.max_ffmpeg_workers, use_gpu=config.use_gpu if config.use_gpu else False, single_pass=config.single_pass_phash)
 
     if phash and config.use_database:
         write_file_to_database(file, phash)
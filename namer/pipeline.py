@@ -0,0 +1,91 @@
+"""
+A staged processing pipeline, each stage runs in its own worker threads and hands items
+to the next stage through a bounded queue.   While one stage works on an item the other
+stages work on the items before and after it, so throughput approaches that of the slowest
+stage rather than the sum of all stages.
+"""
+
+from queue import Queue
+from threading import Lock, Thread
+from typing import Any, Callable, List, Optional, Tuple
+
+from loguru import logger
+
+StageFunction = Callable[[Any], Optional[Any]]
+
+
+class Pipeline:
+    """
+    Items put in to the pipeline are passed through each stage function in order, the output of a stage
+    is the input of the next one.   Should a stage return None, or raise an exception, the item is dropped.
+
+    on_complete is called with the item that entered the last stage an item reached, once it leaves the pipeline.
+    """
+
+    def __init__(self, stages: List[Tuple[str, StageFunction]], workers: int = 1, maxsize: int = 1, on_complete: Optional[Callable[[Any], None]] = None):
+        self.__stages = stages
+        self.__workers = max(workers, 1)
+        self.__on_complete = on_complete
+        self.__queues: List[Queue] = [Queue(maxsize=maxsize) for _ in stages]
+        self.__running: List[int] = [self.__workers for _ in stages]
+        self.__running_lock = Lock()
+        self.__threads: List[Thread] = [Thread(target=self.__stage_thread, args=(idx,), daemon=True, name=f'namer-{name}-{worker}') for idx, (name, _) in enumerate(stages) for worker in range(self.__workers)]
+
+    def start(self):
+        for thread in self.__threads:
+            thread.start()
+
+    def put(self, item: Any):
+        """
+        Adds an item to the first stage, blocks while that stage's queue is full.
+        """
+        self.__queues[0].put(item)
+
+    def stop(self):
+        """
+        Lets all items already in the pipeline complete, then stops the stage threads.
+        """
+        for _ in range(self.__workers):
+            self.__queues[0].put(None)
+
+        for thread in self.__threads:
+            thread.join()
+
+    def __stage_thread(self, idx: int):
+        name, function = self.__stages[idx]
+        queue = self.__queues[idx]
+        is_last = idx + 1 == len(self.__stages)
+        while True:
+            item = queue.get()
+            if item is None:
+                queue.task_done()
+                break
+
+            output = None
+            try:
+                output = function(item)
+            except Exception:
+                logger.exception('Pipeline stage {} failed', name)
+
+            if output is not None and not is_last:
+                self.__queues[idx + 1].put(output)
+            else:
+                self.__complete(item)
+
+            queue.task_done()
+
+        # the last worker of a stage to exit stops the workers of the next stage.
+        with self.__running_lock:
+            self.__running[idx] -= 1
+            stopped = self.__running[idx] == 0
+
+        if stopped and not is_last:
+            for _ in range(self.__workers):
+                self.__queues[idx + 1].put(None)
+
+    def __complete(self, item: Any):
+        if self.__on_complete:
+            try:
+                self.__on_complete(item)
+            except Exception:
+                logger.exception('Pipeline completion failed')
@@ -0,0 +1,100 @@
+"""
+A process wide limit on the ffmpeg (and ffprobe, videohashes) subprocesses run at once, so hashing a few files with
+many screenshots each doesn't start hundreds of decoders.
+"""
+
+import os
+from collections import deque
+from contextlib import contextmanager
+from enum import Enum
+from threading import Condition
+from time import monotonic
+from typing import Deque, Dict, Iterator, Optional
+
+from loguru import logger
+
+
+class ProcessKind(Enum):
+    PROBE = 'probe'
+    SCREENSHOT = 'screenshot'
+    SCREENSHOTS = 'screenshots'
+    REMUX = 'remux'
+    PHASH = 'phash'
+
+
+DEFAULT_WEIGHTS: Dict[ProcessKind, int] = {
+    ProcessKind.PROBE: 1,
+    ProcessKind.SCREENSHOT: 2,
+    ProcessKind.SCREENSHOTS: 4,
+    ProcessKind.REMUX: 4,
+    ProcessKind.PHASH: 8,
+}
+
+
+class ProcessBudget:
+    """
+    Each subprocess takes its kind's weight from the budget while it runs, a probe costs less than a remux, processes
+    that don't fit wait for others to finish, in the order they asked.   A process weighing more than the whole budget
+    runs alone.   The time processes waited is kept per kind, see stats.
+    """
+
+    __budget: int = 2 * (os.cpu_count() or 1)
+    __weights: Dict[ProcessKind, int] = dict(DEFAULT_WEIGHTS)
+    __used: int = 0
+    __waiting: Deque[object] = deque()
+    __condition = Condition()
+    __stats: Dict[ProcessKind, Dict[str, float]] = {}
+
+    @staticmethod
+    def configure(budget: Optional[int] = None, weights: Optional[Dict[ProcessKind, int]] = None):
+        """
+        Sets the budget, by default twice the number of cores, and the weights of kinds of processes.
+        """
+        with ProcessBudget.__condition:
+            ProcessBudget.__budget = max(budget if budget else 2 * (os.cpu_count() or 1), 1)
+            ProcessBudget.__weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+            ProcessBudget.__condition.notify_all()
+
+    @staticmethod
+    @contextmanager
+    def run(kind: ProcessKind) -> Iterator[None]:
+        """
+        Waits until a process of kind fits in the budget, the process is run in the with block.
+        """
+        ticket = object()
+        start = monotonic()
+        with ProcessBudget.__condition:
+            ProcessBudget.__waiting.append(ticket)
+            weight = min(ProcessBudget.__weights[kind], ProcessBudget.__budget)
+            while ProcessBudget.__waiting[0] is not ticket or ProcessBudget.__used + weight > ProcessBudget.__budget:
+                ProcessBudget.__condition.wait()
+                weight = min(ProcessBudget.__weights[kind], ProcessBudget.__budget)
+
+            ProcessBudget.__waiting.popleft()
+            ProcessBudget.__used += weight
+            waited = monotonic() - start
+            stats = ProcessBudget.__stats.setdefault(kind, {'count': 0, 'running': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0})
+            stats['count'] += 1
+            stats['running'] += 1
+            stats['wait_seconds'] += waited
+            stats['max_wait_seconds'] = max(stats['max_wait_seconds'], waited)
+            ProcessBudget.__condition.notify_all()
+
+        if waited >= 1:
+            logger.debug('{} process waited {:.1f} seconds to run', kind.value, waited)
+
+        try:
+            yield
+        finally:
+            with ProcessBudget.__condition:
+                ProcessBudget.__used -= weight
+                stats['running'] -= 1
+                ProcessBudget.__condition.notify_all()
+
+    @staticmethod
+    def stats() -> Dict[str, Dict[str, float]]:
+        """
+        Per kind of process, how many were run, are running, and the total and longest time they waited to run.
+        """
+        with ProcessBudget.__condition:
+            return {kind.value: dict(stats) for kind, stats in ProcessBudget.__stats.items()}
@@ -0,0 +1,132 @@
+"""
+Waits for new files to stop changing before they are processed, without blocking the thread that noticed them.
+"""
+
+import heapq
+import os
+import time
+from pathlib import Path
+from threading import Condition, Thread
+from typing import Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+
+class Settler:
+    """
+    Files added to the settler are checked every interval seconds, in a single background thread, a file whose size and
+    modification time stayed the same for interval (or extra_time, if longer) seconds, and isn't in_use, is passed to
+    on_settled.   While is_busy returns True settled files wait, busy_interval seconds at a time.
+
+    Pending checks are kept in a heap ordered by due time, so the thread only wakes when the next check is due.
+    Files that disappear are dropped.
+    """
+
+    def __init__(self, on_settled: Callable[[Path], None], interval: float = 2, extra_time: float = 0, in_use: Optional[Callable[[Path], bool]] = None, is_busy: Optional[Callable[[], bool]] = None, busy_interval: float = 5):
+        self.__on_settled = on_settled
+        self.__interval = interval
+        self.__extra_time = extra_time
+        self.__in_use = in_use
+        self.__is_busy = is_busy
+        self.__busy_interval = busy_interval
+        self.__heap: List[Tuple[float, int, Path]] = []
+        self.__sequence = 0
+        # path -> ((size, mtime), time that stat was first seen)
+        self.__pending: Dict[Path, Tuple[Optional[Tuple[int, int]], float]] = {}
+        self.__condition = Condition()
+        self.__stopped = False
+        self.__thread = Thread(target=self.__settle_thread, daemon=True, name='namer-settler')
+
+    def start(self):
+        self.__thread.start()
+
+    def stop(self):
+        """
+        Stops the settling thread, pending files are dropped.
+        """
+        with self.__condition:
+            self.__stopped = True
+            self.__condition.notify_all()
+
+        if self.__thread.is_alive():
+            self.__thread.join()
+
+    def add(self, path: Path):
+        """
+        Starts watching a file, a file that is already pending isn't added twice.
+        """
+        with self.__condition:
+            if path in self.__pending or self.__stopped:
+                return
+
+            self.__pending[path] = (None, time.monotonic())
+            self.__schedule(path, time.monotonic())
+
+    def pending(self) -> int:
+        with self.__condition:
+            return len(self.__pending)
+
+    def __schedule(self, path: Path, due: float):
+        self.__sequence += 1
+        heapq.heappush(self.__heap, (due, self.__sequence, path))
+        self.__condition.notify_all()
+
+    def __settle_thread(self):
+        while True:
+            with self.__condition:
+                while not self.__stopped and (not self.__heap or self.__heap[0][0] > time.monotonic()):
+                    self.__condition.wait(self.__heap[0][0] - time.monotonic() if self.__heap else None)
+
+                if self.__stopped:
+                    return
+
+                _, _, path = heapq.heappop(self.__heap)
+
+            try:
+                if self.__check(path):
+                    self.__on_settled(path)
+            except Exception:
+                logger.exception('Could not settle {}', path)
+
+    def __check(self, path: Path) -> bool:
+        """
+        Returns True once the file settled, otherwise schedules its next check.
+        """
+        now = time.monotonic()
+        try:
+            stat = os.stat(path)
+        except OSError:
+            with self.__condition:
+                self.__pending.pop(path, None)
+
+            return False
+
+        key = (stat.st_size, stat.st_mtime_ns)
+        with self.__condition:
+            last_key, since = self.__pending[path]
+            if key != last_key:
+                self.__pending[path] = (key, now)
+                self.__schedule(path, now + self.__interval)
+                return False
+
+            remaining = since + max(self.__interval, self.__extra_time) - now
+            if remaining > 0:
+                self.__schedule(path, now + remaining)
+                return False
+
+        if self.__in_use and self.__in_use(path):
+            with self.__condition:
+                self.__schedule(path, now + self.__interval)
+
+            return False
+
+        if self.__is_busy and self.__is_busy():
+            with self.__condition:
+                self.__schedule(path, now + self.__busy_interval)
+
+            return False
+
+        with self.__condition:
+            self.__pending.pop(path, None)
+
+        return True
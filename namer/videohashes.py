@@ -1,31 +1,115 @@
 import argparse
+import multiprocessing
+import os
 import sys
+from concurrent.futures import as_completed, ProcessPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import List, Optional, Tuple
 
+import orjson
 from loguru import logger
 
+from namer.configuration import NamerConfig
 from namer.configuration_utils import default_config
+from namer.database import bind_database, is_database_bound, search_file_in_database, write_files_to_database
 from namer.namer import calculate_phash
+from namer.videophash import PerceptualHash
+
+__worker_config: Optional[NamerConfig] = None
 
 
 def main(args_list: List[str]):
     """
-    Command line interface to calculate hashes for a file.
+    Command line interface to calculate hashes for a file, or all files in a directory.
     """
     description = """
-    Command line interface to calculate hashes for a file
+    Command line interface to calculate hashes for a file, or all files in a directory (recursively) as json lines,
+    files in a directory already in the namer database are skipped, and new hashes are written to it.
     """
     parser = argparse.ArgumentParser(description=description)
     parser.add_argument('-c', '--configfile', help='override location for a configuration file.', type=Path)
-    parser.add_argument('-f', '--file', help='File we want to provide a match name for.', required=True, type=Path)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('-f', '--file', help='File we want to provide a match name for.', type=Path)
+    target.add_argument('-d', '--dir', help='Directory of files to hash.', type=Path)
+    parser.add_argument('-j', '--jobs', help='number of files hashed at once, defaults to the number of cores.', type=int, default=os.cpu_count())
+    parser.add_argument('-b', '--batch', help='number of hashes written to the database per transaction.', type=int, default=100)
     parser.add_argument('-v', '--verbose', help='verbose, print logs', action='store_true')
     args = parser.parse_args(args=args_list)
 
-    config = default_config(args.configfile.resolve() if args.configfile else None)
+    config_file = args.configfile.resolve() if args.configfile else None
+    config = default_config(config_file)
     if args.verbose:
         level = 'DEBUG' if config.debug else 'INFO'
         logger.add(sys.stdout, format=config.console_format, level=level, diagnose=config.diagnose_errors)
 
-    file_hash = calculate_phash(args.file.resolve(), config)
-    print(file_hash.to_dict())
+    if args.file:
+        file_hash = calculate_phash(args.file.resolve(), config)
+        print(file_hash.to_dict())
+    else:
+        if config.use_database and not is_database_bound():
+            bind_database(config.database_path / 'namer_database.sqlite')
+
+        files = [file for file in sorted(args.dir.resolve().rglob('**/*')) if __needs_hash(file, config)]
+        hash_files(files, config, config_file, args.jobs, args.batch)
+
+
+def hash_files(files: List[Path], config: NamerConfig, config_file: Optional[Path], jobs: int, batch_size: int = 100):
+    """
+    Hashes files with a pool of processes (each loading config_file), printing a json line per hashed file as they
+    finish, and writing the hashes to the database (if used) in transactions of batch_size files.
+    """
+    batch: List[Tuple[Path, PerceptualHash]] = []
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=max(jobs, 1), mp_context=context, initializer=_init_worker, initargs=(config_file,)) as executor:
+        futures = {executor.submit(_hash_file, file): file for file in files}
+        for future in as_completed(futures):
+            file = futures[future]
+            file_hash = None
+            try:
+                file_hash = future.result()
+            except Exception as error:
+                logger.error('Could not hash file {}: {}', file, error)
+
+            if not file_hash:
+                continue
+
+            print(orjson.dumps({'file': str(file), **file_hash.to_dict()}).decode('UTF-8'), flush=True)
+            if config.use_database:
+                batch.append((file, file_hash))
+                if len(batch) >= batch_size:
+                    __write_batch(batch)
+
+    if batch:
+        __write_batch(batch)
+
+
+def __write_batch(batch: List[Tuple[Path, PerceptualHash]]):
+    write_files_to_database(batch)
+    batch.clear()
+
+
+def __needs_hash(file: Path, config: NamerConfig) -> bool:
+    if not file.is_file() or file.suffix.lower()[1:] not in config.target_extensions:
+        return False
+
+    if config.use_database:
+        search_result = search_file_in_database(file)
+        return not search_result or not search_result.phash
+
+    return True
+
+
+def _init_worker(config_file: Optional[Path]):
+    global __worker_config
+
+    # the database is written by the main process only.
+    __worker_config = default_config(config_file)
+    __worker_config.use_database = False
+
+
+def _hash_file(file: Path) -> Optional[PerceptualHash]:
+    if not __worker_config:
+        raise RuntimeError('worker is not initialized')
+
+    return calculate_phash(file, __worker_config)
+
@@ -17,73 +17,87 @@ except (AttributeError, ImportError):
 class ImageHash:
     """
     Hash encapsulation. Can be used for dictionary keys and comparisons.
+
+    The bits are packed in to an int, first bit of the hash as the most significant bit,
+    so the hamming distance between two hashes is the bit count of their xor.
     """
 
-    def __init__(self, binary_array: NDArray) -> None:
-        self.hash = binary_array
+    value: int
+    bit_count: int
+
+    def __init__(self, value: int, bit_count: int = 64) -> None:
+        self.value = value
+        self.bit_count = bit_count
+
+    @staticmethod
+    def from_array(binary_array: NDArray) -> 'ImageHash':
+        return ImageHash(_binary_array_to_int(binary_array), binary_array.size)
+
+    @property
+    def hash(self) -> NDArray:
+        """
+        The bits of the hash, as a square array when the bit count allows it.
+        """
+        bits = numpy.unpackbits(numpy.frombuffer(self.value.to_bytes((self.bit_count + 7) // 8, 'big'), dtype=numpy.uint8))[-self.bit_count :].astype(bool)
+        hash_size = int(numpy.sqrt(self.bit_count))
+        return bits.reshape(hash_size, hash_size) if hash_size * hash_size == self.bit_count else bits
+
+    @hash.setter
+    def hash(self, binary_array: NDArray) -> None:
+        # hashes pickled by older versions, in namer logs, are restored by setting their bits as an array.
+        self.value = _binary_array_to_int(binary_array)
+        self.bit_count = binary_array.size
 
     def __str__(self) -> str:
-        return _binary_array_to_hex(self.hash.flatten())
+        return '{:0>{width}x}'.format(self.value, width=(self.bit_count + 3) // 4)
 
     def __repr__(self) -> str:
-        return repr(self.hash)
+        return f'ImageHash({self})'
 
     def __sub__(self, other: 'ImageHash') -> int:
         if other is None:
             raise TypeError('Other hash must not be None.')
 
-        if self.hash.size != other.hash.size:
-            raise TypeError('ImageHashes must be of the same shape.', self.hash.shape, other.hash.shape)
+        if self.bit_count != other.bit_count:
+            raise TypeError('ImageHashes must be of the same length.', self.bit_count, other.bit_count)
 
-        return numpy.count_nonzero(self.hash.flatten() != other.hash.flatten())
+        return (self.value ^ other.value).bit_count()
 
     def __eq__(self, other: object) -> bool:
-        if other is None:
+        if not isinstance(other, ImageHash):
             return False
 
-        return numpy.array_equal(self.hash.flatten(), other.hash.flatten())  # type: ignore
+        return self.value == other.value and self.bit_count == other.bit_count
 
     def __ne__(self, other: object) -> bool:
         if other is None:
             return False
 
-        return not numpy.array_equal(self.hash.flatten(), other.hash.flatten())  # type: ignore
+        return not self.__eq__(other)
 
     def __hash__(self) -> int:
-        # this returns an 8-bit integer, intentionally shortening the information
-        return sum([2 ** (i % 8) for i, v in enumerate(self.hash.flatten()) if v])
+        return hash(self.value)
 
     def __len__(self) -> int:
         # Returns the bit length of the hash
-        return self.hash.size
+        return self.bit_count
 
 
-def _binary_array_to_hex(arr):
+def _binary_array_to_int(arr: NDArray) -> int:
     """
-    internal function to make a hex string out of a binary array.
+    internal function to pack a binary array in to an int, first bit as the most significant bit.
     """
-    bit_string = ''.join(str(b) for b in 1 * arr.flatten())
-    width = int(numpy.ceil(len(bit_string) / 4))
-    return '{:0>{width}x}'.format(int(bit_string, 2), width=width)
+    bits = numpy.asarray(arr, dtype=bool).flatten()
+    packed = numpy.packbits(bits).tobytes()
+    return int.from_bytes(packed, 'big') >> (len(packed) * 8 - bits.size)
 
 
 def hex_to_hash(hex_str: str) -> ImageHash:
     """
     Convert a stored hash (hex, as retrieved from str(Imagehash))
     back to an Imagehash object.
-
-    Notes:
-    1. This algorithm assumes all hashes are either
-            bidimensional arrays with dimensions hash_size * hash_size,
-            or one-dimensional arrays with dimensions binbits * 14.
-    2. This algorithm does not work for hash_size < 2.
     """
-    hash_size = int(numpy.sqrt(len(hex_str) * 4))
-    # assert hash_size == numpy.sqrt(len(hex_str)*4)
-    binary_array = '{:0>{width}b}'.format(int(hex_str, 16), width=hash_size * hash_size)
-    bit_rows = [binary_array[i : i + hash_size] for i in range(0, len(binary_array), hash_size)]
-    hash_array = numpy.array([[bool(int(d)) for d in row] for row in bit_rows])
-    return ImageHash(hash_array)
+    return ImageHash(int(hex_str, 16), len(hex_str) * 4)
 
 
 def phash(image: Image.Image, hash_size=8, high_freq_factor=4, resample: Literal[0, 1, 2, 3, 4, 5] = Image.Resampling.LANCZOS) -> Optional[ImageHash]:  # type: ignore
@@ -99,4 +113,4 @@ def phash(image: Image.Image, hash_size=8, high_freq_factor=4, resample: Literal
     med = numpy.median(dct_low_freq)
     diff = dct_low_freq > med
 
-    return ImageHash(diff)
+    return ImageHash.from_array(diff)
@@ -0,0 +1,103 @@
+from typing import Dict, Generic, List, Tuple, TypeVar
+
+import numpy
+
+from namer.videophash.imagehash import ImageHash
+
+T = TypeVar('T')
+
+
+class PhashIndex(Generic[T]):
+    """
+    In memory nearest neighbour index of 64 bit phashes, each stored with an item (a file name, an id...).
+
+    The hashes are packed in a uint64 array, a search compares a hash with all of them at once by xor and bit count,
+    which takes milliseconds for millions of hashes.   Finding duplicates uses multi-index hashing, two hashes within
+    a distance k are equal in at least one of k + 1 ranges of their bits, so only hashes sharing a range are compared.
+    """
+
+    __values: List[int]
+    __items: List[T]
+    __packed: numpy.ndarray
+
+    def __init__(self):
+        self.__values = []
+        self.__items = []
+        self.__packed = numpy.empty(0, dtype=numpy.uint64)
+
+    def add(self, phash: ImageHash, item: T):
+        if len(phash) != 64:
+            raise ValueError(f'only 64 bit hashes can be indexed, not {len(phash)} bits')
+
+        self.__values.append(phash.value)
+        self.__items.append(item)
+
+    def __len__(self) -> int:
+        return len(self.__items)
+
+    def __array(self) -> numpy.ndarray:
+        if len(self.__packed) != len(self.__values):
+            self.__packed = numpy.array(self.__values, dtype=numpy.uint64)
+
+        return self.__packed
+
+    def search(self, phash: ImageHash, max_distance: int) -> List[Tuple[int, T]]:
+        """
+        Items with a hash within max_distance of phash, closest first, as (distance, item).
+        """
+        distances = numpy.bitwise_count(self.__array() ^ numpy.uint64(phash.value))
+        found = numpy.flatnonzero(distances <= max_distance)
+        found = found[numpy.argsort(distances[found], kind='stable')]
+
+        return [(int(distances[idx]), self.__items[idx]) for idx in found]
+
+    def duplicates(self, max_distance: int) -> List[List[T]]:
+        """
+        Groups of items whose hashes are within max_distance of another hash of the group, in the order they were added.
+        """
+        values, inverse = numpy.unique(self.__array(), return_inverse=True)
+
+        # union find over the distinct hashes, items sharing a hash are always in the same group.
+        parents = list(range(len(values)))
+
+        def find(idx: int) -> int:
+            while parents[idx] != idx:
+                parents[idx] = parents[parents[idx]]
+                idx = parents[idx]
+
+            return idx
+
+        if max_distance > 0:
+            for first, second in self.__near_pairs(values, max_distance):
+                parents[find(first)] = find(second)
+
+        groups: Dict[int, List[T]] = {}
+        for idx, value_idx in enumerate(inverse):
+            groups.setdefault(find(int(value_idx)), []).append(self.__items[idx])
+
+        return [group for group in groups.values() if len(group) > 1]
+
+    @staticmethod
+    def __near_pairs(values: numpy.ndarray, max_distance: int, block_size: int = 1024) -> List[Tuple[int, int]]:
+        pairs = set()
+
+        chunks = min(max_distance + 1, 64)
+        bounds = [64 * chunk // chunks for chunk in range(chunks + 1)]
+        for low, high in zip(bounds, bounds[1:]):
+            keys = (values >> numpy.uint64(low)) & numpy.uint64((1 << (high - low)) - 1)
+            order = numpy.argsort(keys, kind='stable')
+            buckets = numpy.split(order, numpy.flatnonzero(numpy.diff(keys[order])) + 1)
+            for bucket in buckets:
+                if len(bucket) < 2:
+                    continue
+
+                bucket_values = values[bucket]
+                for start in range(0, len(bucket), block_size):
+                    block = bucket_values[start : start + block_size]
+                    distances = numpy.bitwise_count(block[:, None] ^ bucket_values[None, :])
+                    rows, columns = numpy.nonzero(distances <= max_distance)
+                    for row, column in zip(rows + start, columns):
+                        if row < column:
+                            pairs.add((int(bucket[row]), int(bucket[column])))
+
+        return list(pairs)
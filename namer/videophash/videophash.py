@@ -22,7 +22,7 @@ class VideoPerceptualHash:
     def __init__(self, ffmpeg: FFMpeg):
         self.__ffmpeg = ffmpeg
 
-    def get_hashes(self, file: Path, max_workers: Optional[int] = None, use_gpu: bool = False) -> Optional[PerceptualHash]:
+    def get_hashes(self, file: Path, max_workers: Optional[int] = None, use_gpu: bool = False, single_pass: bool = False) -> Optional[PerceptualHash]:
         data = None
 
         probe = self.__ffmpeg.ffprobe(file)
@@ -30,7 +30,7 @@ class VideoPerceptualHash:
             return data
 
         duration = probe.get_format().duration
-        phash = self.get_phash(file, duration, max_workers, use_gpu)
+        phash = self.get_phash(file, duration, max_workers, use_gpu, single_pass)
         if phash:
             file_oshash = self.get_oshash(file)
 
@@ -38,29 +38,29 @@ class VideoPerceptualHash:
 
         return data
 
-    def get_phash(self, file: Path, duration: float, max_workers: Optional[int], use_gpu: bool) -> Optional[imagehash.ImageHash]:
+    def get_phash(self, file: Path, duration: float, max_workers: Optional[int], use_gpu: bool, single_pass: bool = False) -> Optional[imagehash.ImageHash]:
         stat = file.stat()
-        return self._get_phash(file, duration, max_workers, use_gpu, stat.st_size, stat.st_mtime)
+        return self._get_phash(file, duration, max_workers, use_gpu, single_pass, stat.st_size, stat.st_mtime)
 
     @lru_cache(maxsize=1024)  # noqa: B019
-    def _get_phash(self, file: Path, duration: float, max_workers: Optional[int], use_gpu: bool, file_size: int, file_update: float) -> Optional[imagehash.ImageHash]:
+    def _get_phash(self, file: Path, duration: float, max_workers: Optional[int], use_gpu: bool, single_pass: bool, file_size: int, file_update: float) -> Optional[imagehash.ImageHash]:
         logger.info(f'Calculating phash for file "{file}"')
-        phash = self.__calculate_phash(file, duration, max_workers, use_gpu)
+        phash = self.__calculate_phash(file, duration, max_workers, use_gpu, single_pass)
         return phash
 
-    def __calculate_phash(self, file: Path, duration: float, max_workers: Optional[int], use_gpu: bool) -> Optional[imagehash.ImageHash]:
+    def __calculate_phash(self, file: Path, duration: float, max_workers: Optional[int], use_gpu: bool, single_pass: bool) -> Optional[imagehash.ImageHash]:
         phash = None
 
-        thumbnail_image = self.__generate_image_thumbnail(file, duration, max_workers, use_gpu)
+        thumbnail_image = self.__generate_image_thumbnail(file, duration, max_workers, use_gpu, single_pass)
         if thumbnail_image:
             phash = imagehash.phash(thumbnail_image, hash_size=8, high_freq_factor=8, resample=Image.Resampling.BILINEAR)  # type: ignore
 
         return phash
 
-    def __generate_image_thumbnail(self, file: Path, duration: float, max_workers: Optional[int], use_gpu: bool) -> Optional[Image.Image]:
+    def __generate_image_thumbnail(self, file: Path, duration: float, max_workers: Optional[int], use_gpu: bool, single_pass: bool) -> Optional[Image.Image]:
         thumbnail_image = None
 
-        thumbnail_list = self.__generate_thumbnails(file, duration, max_workers, use_gpu)
+        thumbnail_list = self.__generate_thumbnails(file, duration, max_workers, use_gpu, single_pass)
         if thumbnail_list:
             thumbnail_image = self.__concat_images(thumbnail_list)
 
@@ -76,7 +76,7 @@ class VideoPerceptualHash:
         file_hash = oshash.oshash(str(file))
         return file_hash
 
-    def __generate_thumbnails(self, file: Path, duration: float, max_workers: Optional[int], use_gpu: bool) -> List[Image.Image]:
+    def __generate_thumbnails(self, file: Path, duration: float, max_workers: Optional[int], use_gpu: bool, single_pass: bool) -> List[Image.Image]:
         duration = int(Decimal(duration * 100).quantize(0, ROUND_HALF_UP)) / 100
 
         chunk_count = self.__columns * self.__rows
@@ -86,11 +86,18 @@ class VideoPerceptualHash:
         if duration / chunk_count < 0.03:
             return []
 
+        times = [offset + (idx * step_size) for idx in range(chunk_count)]
+        if single_pass:
+            images = self.__ffmpeg.extract_screenshots(file, times, self.__screenshot_width, use_gpu)
+            if len(images) == chunk_count:
+                return images
+
+            logger.warning(f'Extracted {len(images)} of {chunk_count} thumbnails in a single pass, extracting them one at a time for file "{file}"')
+
         queue = []
         with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            for idx in range(chunk_count):
-                time = offset + (idx * step_size)
-                future = executor.submit(self.__ffmpeg.extract_screenshot, file, time, self.__screenshot_width, use_gpu)
+            for time in times:
+                future = executor.submit(self.__ffmpeg.extract_screenshot, file, time, self.__screenshot_width, use_gpu, raw=True)
                 queue.append(future)
 
         concurrent.futures.wait(queue)
@@ -0,0 +1,75 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from threading import Lock
+from typing import Optional
+
+from loguru import logger
+
+from namer.ffmpeg import FFMpeg
+from namer.videophash import imagehash
+from namer.videophash.videophash import VideoPerceptualHash
+
+__worker_vph: Optional[VideoPerceptualHash] = None
+
+
+class ProcessPoolVideoPerceptualHash(VideoPerceptualHash):
+    """
+    Calculates phashes in a pool of processes shared by all files hashed at once, so concatenating the thumbnails and
+    the dct of one file don't hold the gil while other files are hashed.   ffprobe results (and the database storing
+    them) and oshashes stay in the calling process.
+
+    max_ffmpeg_workers is split between the processes, so no more than max(max_ffmpeg_workers, processes) ffmpeg
+    processes extract thumbnails at once.
+    """
+
+    __processes: int
+    __executor: Optional[ProcessPoolExecutor]
+
+    def __init__(self, ffmpeg: FFMpeg, processes: int):
+        super().__init__(ffmpeg)
+        self.__processes = max(processes, 1)
+        self.__executor = None
+        self.__lock = Lock()
+
+    @lru_cache(maxsize=1024)  # noqa: B019
+    def _get_phash(self, file: Path, duration: float, max_workers: Optional[int], use_gpu: bool, single_pass: bool, file_size: int, file_update: float) -> Optional[imagehash.ImageHash]:
+        logger.info(f'Calculating phash for file "{file}" in a process pool')
+        future = self.__get_executor().submit(_calculate_phash, file, duration, self.__ffmpeg_workers(max_workers), use_gpu, single_pass)
+        return future.result()
+
+    def __ffmpeg_workers(self, max_workers: Optional[int]) -> int:
+        workers = max_workers if max_workers else os.cpu_count() or 1
+        return max(workers // self.__processes, 1)
+
+    def __get_executor(self) -> ProcessPoolExecutor:
+        # created on first use, and reused for all files.
+        with self.__lock:
+            if not self.__executor:
+                context = multiprocessing.get_context('spawn')
+                self.__executor = ProcessPoolExecutor(max_workers=self.__processes, mp_context=context, initializer=_init_worker)
+
+            return self.__executor
+
+
+@lru_cache(maxsize=None)
+def get_process_pool_vph(ffmpeg: FFMpeg, processes: int) -> ProcessPoolVideoPerceptualHash:
+    """
+    The pool hashing files with processes processes, one per process count, shared by all callers.
+    """
+    return ProcessPoolVideoPerceptualHash(ffmpeg, processes)
+
+
+def _init_worker():
+    global __worker_vph
+
+    __worker_vph = VideoPerceptualHash(FFMpeg())
+
+
+def _calculate_phash(file: Path, duration: float, max_workers: int, use_gpu: bool, single_pass: bool) -> Optional[imagehash.ImageHash]:
+    if not __worker_vph:
+        raise RuntimeError('worker is not initialized')
+
+    return __worker_vph.get_phash(file, duration, max_workers, use_gpu, single_pass)
@@ -8,6 +8,7 @@ import orjson
 from loguru import logger
 from orjson import JSONDecodeError
 
+from namer.processbudget import ProcessBudget, ProcessKind
 from namer.videophash import PerceptualHash, return_perceptual_hash
 
 
@@ -69,7 +70,7 @@ class StashVideoPerceptualHash:
                 '--video', str(file)
             ])
 
-        with subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True) as process:
+        with ProcessBudget.run(ProcessKind.PHASH), subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True) as process:
             stdout, stderr = process.communicate()
             stdout, stderr = stdout.strip(), stderr.strip()
 
@@ -3,6 +3,7 @@ A file watching service to rename movie files and move them
 to relevant locations after match the file against the theporndb.
 """
 
+import errno
 import os
 import shutil
 import sys
@@ -11,21 +12,27 @@ import time
 from contextlib import suppress
 from pathlib import Path
 from platform import system
-from queue import Queue
-from threading import Thread
-from typing import Optional
+from stat import S_ISDIR
+from threading import Condition, Event, Thread
+from typing import Dict, List, Optional, Set
 
 import schedule
 from loguru import logger
-from watchdog.events import EVENT_TYPE_MODIFIED, EVENT_TYPE_MOVED, FileSystemEvent, PatternMatchingEventHandler
-from watchdog.observers.polling import PollingObserver
+from watchdog.events import EVENT_TYPE_MODIFIED, EVENT_TYPE_MOVED, FileSystemEvent, FileSystemEventHandler, PatternMatchingEventHandler
+from watchdog.observers import Observer
+from watchdog.observers.api import BaseObserver
+from watchdog.observers.polling import PollingObserver, PollingObserverVFS
 
-from namer.command import Command, gather_target_files_from_dir, is_interesting_movie, make_command_relative_to, move_command_files
+from namer.command import Command, CommandQueue, gather_target_files_from_dir, is_interesting_movie, make_command, make_command_relative_to, move_command_to_work_dir
 from namer.configuration import NamerConfig
 from namer.configuration_utils import verify_configuration
+from namer.database import get_queued_commands, QueueStage, remove_queued_command, set_queued_command_stage
+from namer.dirsnapshot import DirSnapshot
 from namer.metadataapi import get_user_info
 from namer.name_formatter import PartialFormatter
-from namer.namer import process_file
+from namer.namer import convert_and_hash, lookup_metadata, move_and_tag, process_file, ProcessingState
+from namer.pipeline import Pipeline
+from namer.settler import Settler
 from namer.web.server import NamerWebServer
 
 
@@ -49,12 +56,79 @@ def __is_file_in_use_unix(file: Path):
         return False
 
 
+def __is_open_for_writing_lease(file: Path) -> Optional[bool]:
+    """
+    A read lease is only granted on files no one has open for writing, returns None if the lease can't be taken at all,
+    as for files owned by another user, or on file systems without leases.
+    """
+    import fcntl
+
+    try:
+        fd = os.open(file, os.O_RDONLY | os.O_NONBLOCK)
+    except OSError:
+        return None
+
+    try:
+        fcntl.fcntl(fd, fcntl.F_SETLEASE, fcntl.F_RDLCK)
+    except OSError as error:
+        return True if error.errno == errno.EAGAIN else None
+    else:
+        fcntl.fcntl(fd, fcntl.F_SETLEASE, fcntl.F_UNLCK)
+        return False
+    finally:
+        os.close(fd)
+
+
+def __is_open_for_writing_proc(file: Path) -> bool:
+    """
+    Looks for file in the open file descriptors of other processes, only processes of the same user, or all when
+    running as root, can be seen.
+    """
+    target = str(file.resolve())
+    own_pid = str(os.getpid())
+    try:
+        pids = [entry.name for entry in os.scandir('/proc') if entry.name.isdigit() and entry.name != own_pid]
+    except OSError:
+        return False
+
+    for pid in pids:
+        try:
+            fds = [entry.name for entry in os.scandir(f'/proc/{pid}/fd')]
+        except OSError:
+            continue
+
+        for fd in fds:
+            with suppress(OSError, ValueError):
+                if os.readlink(f'/proc/{pid}/fd/{fd}') != target:
+                    continue
+
+                fdinfo = Path(f'/proc/{pid}/fdinfo/{fd}').read_text()
+                flags = next(int(line.split()[1], 8) for line in fdinfo.splitlines() if line.startswith('flags:'))
+                if flags & os.O_ACCMODE != os.O_RDONLY:
+                    return True
+
+    return False
+
+
+def __is_file_in_use_linux(file: Path) -> bool:
+    in_use = __is_open_for_writing_lease(file)
+    if in_use is None:
+        in_use = __is_open_for_writing_proc(file)
+
+    return in_use
+
+
 def is_file_in_use(file: Optional[Path]):
+    """
+    Whether another process has the file open, on linux open for writing, as while the file is still being copied.
+    """
     if not file or not file.exists():
         return False
 
     if system() == 'Windows':
         return __is_file_in_use_windows(file)
+    elif system() == 'Linux':
+        return __is_file_in_use_linux(file)
     else:
         return __is_file_in_use_unix(file)
 
@@ -105,6 +179,22 @@ def is_fs_case_sensitive():
         return not Path(tmp_file.name.lower()).is_file()
 
 
+class ObserverTestHandler(FileSystemEventHandler):
+    """
+    Notices events of a test file, to check file events are delivered for a directory.
+    """
+
+    def __init__(self, file_name: str):
+        super().__init__()
+        self.file_name = file_name
+        self.seen = Event()
+
+    def on_any_event(self, event: FileSystemEvent):
+        paths = [event.src_path, getattr(event, 'dest_path', '')]
+        if any(os.path.basename(os.fsdecode(path)) == self.file_name for path in paths if path):
+            self.seen.set()
+
+
 class MovieEventHandler(PatternMatchingEventHandler):
     """
     When a new movie file is detected, this class handles the event,
@@ -112,13 +202,12 @@ class MovieEventHandler(PatternMatchingEventHandler):
     """
 
     __namer_config: NamerConfig
-    __command_queue: Queue
 
-    def __init__(self, namer_config: NamerConfig, enqueue_work_fn, command_queue: Queue):
+    def __init__(self, namer_config: NamerConfig, enqueue_work_fn, settle_fn):
         super().__init__(patterns=['*.*'], case_sensitive=is_fs_case_sensitive(), ignore_directories=True, ignore_patterns=None)
         self.__namer_config = namer_config
         self.__enqueue_work_fn = enqueue_work_fn
-        self.__command_queue = command_queue
+        self.__settle_fn = settle_fn
 
     def on_any_event(self, event: FileSystemEvent):
         file_path = None
@@ -133,24 +222,15 @@ class MovieEventHandler(PatternMatchingEventHandler):
                 logger.error('file should be in watch dir {}', path)
                 return
 
+            # the size of a file still being copied is checked once it settled, this thread never waits for copies.
             relative_path = str(path.relative_to(self.__namer_config.watch_dir))
-            if not self.__namer_config.ignored_dir_regex.search(relative_path) and is_interesting_movie(path, self.__namer_config) and done_copying(path):
-                logger.info('watchdog process called for {}', relative_path)
-
-                # Extra wait time in case other files are copies in as well.
-                if self.__namer_config.del_other_files:
-                    time.sleep(self.__namer_config.extra_sleep_time)
-
-                if self.__namer_config.queue_limit > 0:
-                    while self.__command_queue.qsize() >= self.__namer_config.queue_limit:
-                        time.sleep(self.__namer_config.queue_sleep_time)
-
-                self.prepare_file_for_processing(path)
+            if not self.__namer_config.ignored_dir_regex.search(relative_path) and path.suffix.lower()[1:] in self.__namer_config.target_extensions:
+                self.__settle_fn(path)
 
     @logger.catch
     def prepare_file_for_processing(self, path: Path):
         command = make_command_relative_to(input_dir=path, relative_to=self.__namer_config.watch_dir, config=self.__namer_config)
-        working_command = move_command_files(command, self.__namer_config.work_dir)
+        working_command = move_command_to_work_dir(command)
         if working_command is not None:
             self.__enqueue_work_fn(working_command)
 
@@ -166,13 +246,12 @@ class MovieWatcher:
     """
 
     def enqueue_work(self, command: Command):
-        queue_items = list(self.__command_queue.queue)
-        items = list(map(lambda x: x.get_command_target(), filter(lambda i: i is not None, queue_items)))
-        if not self.__stopped and command.get_command_target() not in items or command is None:
-            self.__command_queue.put(command)
-        else:
+        if self.__stopped:
             raise RuntimeError('Command not added to work queue, server is stopping')
 
+        if not self.__command_queue.put_unique(command):
+            logger.info('{} is already queued', command.get_command_target())
+
     def __processing_thread(self):
         while True:
             command = self.__command_queue.get()
@@ -181,25 +260,78 @@ class MovieWatcher:
                 self.__command_queue.task_done()
                 break
 
-            handle(command)
-            self.__command_queue.task_done()
+            target = command.get_command_target()
+            with self.__active_targets_condition:
+                # another worker is processing the same target, wait for it to finish.
+                while target in self.__active_targets:
+                    self.__active_targets_condition.wait()
+
+                self.__active_targets.add(target)
 
-        # Throw away any items after the None item is processed.
-        with self.__command_queue.mutex:
-            self.__command_queue.queue.clear()
+            set_queued_command_stage(command.input_file, QueueStage.PROCESSING)
+            if self.__pipeline and command.target_movie_file is not None:
+                state = ProcessingState()
+                state.command = command
+                with self.__active_targets_condition:
+                    self.__pipeline_targets[id(state)] = target
+
+                # the command is marked as done once it leaves the pipeline, see __pipeline_complete.
+                self.__pipeline.put(state)
+                continue
+
+            try:
+                handle(command)
+            finally:
+                remove_queued_command(command.input_file)
+                self.__release_target(target)
+
+            self.__command_queue.task_done()
 
         logger.info('exit processing_thread')
 
+    def __release_target(self, target: str):
+        with self.__active_targets_condition:
+            self.__active_targets.discard(target)
+            self.__active_targets_condition.notify_all()
+
+    def __pipeline_complete(self, state: ProcessingState):
+        with self.__active_targets_condition:
+            target = self.__pipeline_targets.pop(id(state), None)
+
+        if target:
+            if state.command:
+                remove_queued_command(state.command.input_file)
+
+            self.__release_target(target)
+            self.__command_queue.task_done()
+
     def __init__(self, namer_config: NamerConfig):
         self.__started = False
         self.__stopped = False
         self.__namer_config = namer_config
         self.__src_path = namer_config.watch_dir
-        self.__event_observer = PollingObserver()
+        # startup scans and polls only list directories that changed, since the last poll or the last run.
+        self.__snapshot_file = namer_config.database_path / 'watch_dir_snapshot.json'
+        self.__snapshot = DirSnapshot(namer_config.watch_dir)
+        self.__snapshot.load(self.__snapshot_file)
+        self.__event_observer = PollingObserverVFS(stat=self.__snapshot.stat, listdir=self.__snapshot.listdir)
         self.__webserver: Optional[NamerWebServer] = None
-        self.__command_queue: Queue = Queue(maxsize=self.__namer_config.queue_limit)
-        self.__worker_thread: Thread = Thread(target=self.__processing_thread, daemon=True)
-        self.__event_handler = MovieEventHandler(namer_config, self.enqueue_work, self.__command_queue)
+        self.__command_queue = CommandQueue(maxsize=self.__namer_config.queue_limit)
+        self.__active_targets: Set[str] = set()
+        self.__active_targets_condition = Condition()
+        # with pipeline processing the stages run the workers, a single thread feeds the pipeline.
+        workers = 1 if self.__namer_config.pipeline_processing else max(self.__namer_config.queue_workers, 1)
+        self.__worker_threads: List[Thread] = [Thread(target=self.__processing_thread, daemon=True, name=f'namer-worker-{idx}') for idx in range(workers)]
+        self.__pipeline: Optional[Pipeline] = None
+        self.__pipeline_targets: Dict[int, str] = {}
+        if self.__namer_config.pipeline_processing:
+            stages = [('hash', convert_and_hash), ('lookup', lookup_metadata), ('move', move_and_tag)]
+            self.__pipeline = Pipeline(stages, workers=self.__namer_config.queue_workers, on_complete=self.__pipeline_complete)
+        # files are passed on once they stopped changing, extra time is given to other files copied with them.
+        extra_time = self.__namer_config.extra_sleep_time if self.__namer_config.del_other_files else 0
+        in_use = is_file_in_use if self.__namer_config.check_open_files else None
+        self.__settler = Settler(self.__settled, interval=self.__namer_config.settle_time, extra_time=extra_time, in_use=in_use, is_busy=self.__is_queue_full, busy_interval=self.__namer_config.queue_sleep_time)
+        self.__event_handler = MovieEventHandler(namer_config, self.enqueue_work, self.__settler.add)
         self.__background_thread: Optional[Thread] = None
 
     def get_config(self) -> NamerConfig:
@@ -271,21 +403,82 @@ class MovieWatcher:
             git_hash = os.environ.get('GIT_HASH')
             print(f'Git Hash: {git_hash}')
 
+        if config.native_observer:
+            native_observer = self.__native_observer()
+            if native_observer:
+                self.__event_observer = native_observer
+            else:
+                logger.warning('File events are not delivered for {}, polling it instead', config.watch_dir)
+
+        self.__settler.start()
         self.__schedule()
-        self.__event_observer.start()
-        self.__worker_thread.start()
+        if not self.__event_observer.is_alive():
+            self.__event_observer.start()
+        if self.__pipeline:
+            self.__pipeline.start()
+
+        for worker_thread in self.__worker_threads:
+            worker_thread.start()
 
-        # touch all existing movie files.
+        self.__resume_queued_commands()
+
+        # touch all existing movie files, cheap checks use the snapshot's (cached) stats first.
         with suppress(FileNotFoundError):
-            for file in self.__namer_config.watch_dir.rglob('**/*.*'):
+            snapshot = self.__snapshot.snapshot()
+            for path in sorted(snapshot.paths):
+                stat = snapshot.stat_info(path)
+                file = Path(path)
+                if S_ISDIR(stat.st_mode) or file.suffix.lower()[1:] not in config.target_extensions or stat.st_size / (1024 * 1024) < config.min_file_size:
+                    continue
+
                 file = file.resolve()
                 if not file.is_relative_to(self.__namer_config.watch_dir):
                     logger.error('file should be in watch dir {}', file)
                     return
 
                 relative_path = str(file.relative_to(self.__namer_config.watch_dir))
-                if not self.__namer_config.ignored_dir_regex.search(relative_path) and is_interesting_movie(file, self.__namer_config) and done_copying(file):
-                    self.__event_handler.prepare_file_for_processing(file)
+                if not self.__namer_config.ignored_dir_regex.search(relative_path):
+                    self.__settler.add(file)
+
+            self.__save_snapshot()
+
+    def __resume_queued_commands(self):
+        """
+        Queues the commands that were queued or processed when namer stopped, commands still being moved to the work dir
+        are rolled back, their files are still in the watch dir (or failed dir).
+        """
+        for queued in get_queued_commands(self.__namer_config.work_dir):
+            work_path, source_path = Path(queued.work_path), Path(queued.source_path)
+            if queued.stage == QueueStage.MOVING and source_path.exists():
+                if work_path.exists():
+                    logger.warning('{} was partially moved to {}, leaving both as they are', source_path, work_path)
+
+                remove_queued_command(work_path)
+                continue
+
+            command = make_command(work_path, self.__namer_config, is_auto=queued.is_auto) if work_path.exists() else None
+            if not command:
+                remove_queued_command(work_path)
+                continue
+
+            logger.info('Resuming {}', work_path)
+            command.tpdb_id = queued.tpdb_id if queued.tpdb_id else None
+            set_queued_command_stage(work_path, QueueStage.QUEUED)
+            self.enqueue_work(command)
+
+    def __settled(self, path: Path):
+        if is_interesting_movie(path, self.__namer_config):
+            logger.info('watchdog process called for {}', path.relative_to(self.__namer_config.watch_dir))
+            self.__event_handler.prepare_file_for_processing(path)
+
+    def __is_queue_full(self) -> bool:
+        return 0 < self.__namer_config.queue_limit <= self.__command_queue.qsize()
+
+    def __save_snapshot(self):
+        try:
+            self.__snapshot.save(self.__snapshot_file)
+        except OSError as error:
+            logger.warning('Could not save the watch dir snapshot {}: {}', self.__snapshot_file, error)
 
     def stop(self):
         """
@@ -296,22 +489,39 @@ class MovieWatcher:
             self.__stopped = True
             logger.debug('Exiting watchdog')
 
-            self.__event_observer.stop()
-            logger.debug('Observer stop')
+            self.__settler.stop()
+
+            # the observer is not started yet while the native observer's self test runs.
+            if self.__event_observer.is_alive():
+                self.__event_observer.stop()
+                logger.debug('Observer stop')
+
+                self.__event_observer.join()
+                logger.debug('Observer join')
 
-            self.__event_observer.join()
-            logger.debug('Observer join')
+            self.__save_snapshot()
 
             if self.__webserver:
                 logger.info('Webserver stop')
                 self.__webserver.stop()
 
-            self.__command_queue.put(None)
+            # one None item per worker, every worker exits after processing one.
+            for _ in self.__worker_threads:
+                self.__command_queue.put(None)
 
-            # let the thread processing work items complete.
-            self.__worker_thread.join()
+            # let the threads processing work items complete.
+            for worker_thread in self.__worker_threads:
+                worker_thread.join()
             logger.debug('Command queue None')
 
+            if self.__pipeline:
+                self.__pipeline.stop()
+                logger.debug('Pipeline stopped')
+
+            # Throw away any items after the None items are processed.
+            with self.__command_queue.mutex:
+                self.__command_queue.queue.clear()
+
             test = os.environ.get('PYTEST_CURRENT_TEST', '')
             logger.debug(f'{test}: Command join')
 
@@ -327,6 +537,40 @@ class MovieWatcher:
 
         return None
 
+    def __native_observer(self) -> Optional[BaseObserver]:
+        """
+        A started observer using the os's file events, if they are delivered for a test file created in the watch dir,
+        they are not for network shares and often not for docker bind mounts.
+        """
+        observer = Observer()
+        if isinstance(observer, PollingObserver):
+            return None
+
+        test_file = self.__src_path / f'.namer_observer_test_{os.getpid()}'
+        handler = ObserverTestHandler(test_file.name)
+        try:
+            watch = observer.schedule(handler, str(self.__src_path), recursive=True)
+            observer.start()
+            try:
+                test_file.touch()
+                handler.seen.wait(5)
+            finally:
+                test_file.unlink(missing_ok=True)
+
+            observer.unschedule(watch)
+        except OSError as error:
+            logger.warning('Could not watch {} for file events: {}', self.__src_path, error)
+
+        if handler.seen.is_set():
+            logger.info('Using file events to watch {}', self.__src_path)
+            return observer
+
+        if observer.is_alive():
+            observer.stop()
+            observer.join()
+
+        return None
+
     def __schedule(self):
         self.__event_observer.schedule(self.__event_handler, str(self.__src_path), recursive=True)
 
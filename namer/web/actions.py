@@ -15,7 +15,7 @@ import jsonpickle
 import orjson
 from werkzeug.routing import Rule
 
-from namer.command import Command, gather_target_files_from_dir, is_interesting_movie, is_relative_to
+from namer.command import Command, CommandQueue, gather_target_files_from_dir, is_interesting_movie, is_relative_to
 from namer.comparison_results import ComparisonResults, SceneType
 from namer.configuration import NamerConfig
 from namer.fileinfo import FileInfo, parse_file_name
@@ -47,12 +47,18 @@ def get_failed_files(config: NamerConfig) -> List[Dict]:
     return list(map(lambda o: command_to_file_info(o, config), gather_target_files_from_dir(config.failed_dir, config)))
 
 
-def get_queued_files(queue: Queue, config: NamerConfig, queue_limit: int = 100) -> List[Dict]:
+def get_queued_files(queue: CommandQueue, config: NamerConfig, queue_limit: int = 100) -> List[Dict]:
     """
-    Get queued files.
+    Get queued files, in the order they will be processed, with their position and estimated wait in seconds.
     """
-    queue_items = list(queue.queue)[:queue_limit]
-    return list(map(lambda x: command_to_file_info(x, config), filter(lambda i: i is not None, queue_items)))
+    queued_files = []
+    for position, (command, estimated_wait) in enumerate(queue.items(queue_limit), start=1):
+        file_info = command_to_file_info(command, config)
+        file_info['position'] = position
+        file_info['estimated_wait'] = int(estimated_wait) if estimated_wait is not None else None
+        queued_files.append(file_info)
+
+    return queued_files
 
 
 def get_queue_size(queue: Queue) -> int:
@@ -3,17 +3,16 @@ Defines the api routes of a Flask webserver for namer.
 """
 
 from pathlib import Path
-from queue import Queue
 
 from flask import Blueprint, jsonify, render_template, request
 from flask.wrappers import Response
 
-from namer.command import make_command_relative_to, move_command_files
+from namer.command import CommandQueue, make_command_relative_to, move_command_to_work_dir
 from namer.configuration import NamerConfig
 from namer.web.actions import delete_file, get_failed_files, get_phash_results, get_queue_size, get_queued_files, get_search_results, human_format, read_failed_log_file
 
 
-def get_routes(config: NamerConfig, command_queue: Queue) -> Blueprint:
+def get_routes(config: NamerConfig, command_queue: CommandQueue) -> Blueprint:
     """
     Builds a blueprint for flask with passed in context, the NamerConfig.
     """
@@ -89,9 +88,11 @@ def get_routes(config: NamerConfig, command_queue: Queue) -> Blueprint:
             res = False
             movie = config.failed_dir / Path(data['file'])
             command = make_command_relative_to(movie, config.failed_dir, config=config, is_auto=False)
-            moved_command = move_command_files(command, config.work_dir, is_auto=False)
+            if command:
+                command.tpdb_id = data['scene_id']
+
+            moved_command = move_command_to_work_dir(command, is_auto=False)
             if moved_command:
-                moved_command.tpdb_id = data['scene_id']
                 command_queue.put(moved_command)  # Todo pass selection
 
         return jsonify(res)
@@ -2,17 +2,16 @@
 Defines the web routes of a Flask webserver for namer.
 """
 
-from queue import Queue
-
 from flask import Blueprint, redirect, render_template, request
 from flask.wrappers import Response
 
+from namer.command import CommandQueue
 from namer.configuration import NamerConfig
 from namer.metadataapi import get_user_info
 from namer.web.actions import get_failed_files, get_queued_files
 
 
-def get_routes(config: NamerConfig, command_queue: Queue) -> Blueprint:
+def get_routes(config: NamerConfig, command_queue: CommandQueue) -> Blueprint:
     """
     Builds a blueprint for flask with passed in context, the NamerConfig.
     """
@@ -5,7 +5,6 @@ A wrapper allowing shutdown of a Flask server.
 import datetime
 import logging
 import mimetypes
-from queue import Queue
 from threading import Thread
 from typing import Any, List, Optional, Union
 
@@ -19,6 +18,7 @@ from waitress import create_server
 from waitress.server import BaseWSGIServer, MultiSocketServer
 from werkzeug.middleware.proxy_fix import ProxyFix
 
+from namer.command import CommandQueue
 from namer.configuration import NamerConfig
 from namer.configuration_utils import from_str_list_lower
 from namer.videophash import ImageHash
@@ -167,9 +167,9 @@ class GenericWebServer:
 
 class NamerWebServer(GenericWebServer):
     __namer_config: NamerConfig
-    __command_queue: Queue
+    __command_queue: CommandQueue
 
-    def __init__(self, namer_config: NamerConfig, command_queue: Queue):
+    def __init__(self, namer_config: NamerConfig, command_queue: CommandQueue):
         self.__namer_config = namer_config
         self.__command_queue = command_queue
         webroot = '/' if not self.__namer_config.web_root else self.__namer_config.web_root
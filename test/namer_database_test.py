@@ -0,0 +1,263 @@
+"""
+Test database.py
+"""
+
+import io
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from contextlib import closing
+from pathlib import Path
+from unittest import mock
+
+from loguru import logger
+
+from namer.database import bind_database, flush_database, migrate_database, get_ffprobe_from_database, get_phash_index, get_queued_commands, QueueStage, search_file_in_database, write_ffprobe_to_database, write_file_to_database, write_files_to_database, write_queued_command, WriteBehind
+from namer.dupes import main as dupes_main
+from namer.ffmpeg import FFMpeg
+from namer.models import db
+from namer.watchdog import create_watcher
+from namer.videophash import return_perceptual_hash
+from namer.videophash.imagehash import hex_to_hash
+from test import utils
+from test.utils import Wait
+
+
+class UnitTestAsTheDefaultExecution(unittest.TestCase):
+    """
+    Always test first.
+    """
+
+    __temp_dir: tempfile.TemporaryDirectory
+    __old_file: Path
+
+    def __init__(self, method_name='runTest'):
+        super().__init__(method_name)
+
+        if not utils.is_debugging():
+            logger.remove()
+
+    @classmethod
+    def setUpClass(cls):
+        if db.provider:
+            raise unittest.SkipTest('the namer database can only be bound once per process')
+
+        # a database created by an older namer, without device, inode and ffprobe columns,
+        # it stays bound (and on disk) until the tests exit.
+        cls.__temp_dir = tempfile.TemporaryDirectory(prefix='test')
+        temp_dir = Path(cls.__temp_dir.name)
+        cls.__old_file = temp_dir / 'old.mp4'
+        cls.__old_file.write_bytes(b'old movie')
+
+        db_file = temp_dir / 'namer_database.sqlite'
+        with closing(sqlite3.connect(db_file)) as connection, connection:
+            connection.execute('CREATE TABLE "File" ("id" INTEGER PRIMARY KEY AUTOINCREMENT, "file_name" TEXT NOT NULL, "file_size" INTEGER NOT NULL, "file_time" REAL NOT NULL, "duration" INTEGER, "phash" TEXT, "oshash" TEXT)')
+            stat = cls.__old_file.stat()
+            connection.execute('INSERT INTO "File" ("file_name", "file_size", "file_time", "duration", "phash", "oshash") VALUES (?, ?, ?, 10, ?, ?)', ('old.mp4', stat.st_size, stat.st_mtime, '88982eebd3552d9c', 'ad1d9ab1f4d4ad0b'))
+
+        bind_database(db_file)
+
+    def test_database_finds_moved_files(self):
+        """
+        Test a database created by an older namer is migrated, and files are found after being renamed.
+        """
+        old_file = self.__old_file
+        new_file = old_file.parent / 'new.mp4'
+        new_file.write_bytes(b'new movie')
+
+        # found by name, and updated with its inode.
+        found = search_file_in_database(old_file)
+        self.assertIsNotNone(found)
+        if found:
+            self.assertEqual(found.phash, '88982eebd3552d9c')
+            self.assertEqual(found.file_inode, old_file.stat().st_ino)
+
+        write_file_to_database(new_file, return_perceptual_hash(20, '88982eebd3552d9d', 'ad1d9ab1f4d4ad0c'))
+        for file in [old_file, new_file]:
+            renamed = file.parent / ('renamed_' + file.name)
+            os.rename(file, renamed)
+            found = search_file_in_database(renamed)
+            self.assertIsNotNone(found)
+            if found:
+                self.assertEqual(found.file_name, renamed.name)
+
+        found = search_file_in_database(old_file.parent / 'renamed_new.mp4')
+        self.assertEqual(found.duration if found else None, 20)
+
+    def test_ffprobe_stored_in_database(self):
+        """
+        Test ffprobe results are stored, and read back without running ffprobe for the same (renamed) file.
+        """
+        file = Path(self.__old_file.parent) / 'probe.mp4'
+        shutil.copy(Path(__file__).resolve().parent / 'Site.22.01.01.painful.pun.XXX.720p.xpost.mp4', file)
+        probed = FFMpeg().ffprobe(file)
+        self.assertIsNotNone(probed)
+
+        renamed = file.parent / 'renamed_probe.mp4'
+        os.rename(file, renamed)
+        with mock.patch('ffmpeg.probe') as probe:
+            stored = FFMpeg().ffprobe(renamed)
+            probe.assert_not_called()
+
+        self.assertIsNotNone(stored)
+        if probed and stored:
+            self.assertEqual(stored.get_resolution(), probed.get_resolution())
+            self.assertEqual(stored.get_format().duration, probed.get_format().duration)
+            self.assertEqual([str(stream) for stream in stored.get_all_streams()], [str(stream) for stream in probed.get_all_streams()])
+            self.assertEqual(stored.get_default_audio_stream(), probed.get_default_audio_stream())
+
+    @mock.patch('sys.stdout', new_callable=io.StringIO)
+    def test_phash_duplicates(self, mock_stdout):
+        """
+        Test files in the database with similar phashes are found, by the index and by the dupes command.
+        """
+        temp_dir = self.__old_file.parent
+        files = []
+        for name, phash in [('dupe_a.mp4', 'f0f0f0f0f0f0f0f0'), ('dupe_b.mp4', 'f0f0f0f0f0f0f0f1'), ('other.mp4', '0f0f0f0f0f0f0f0f')]:
+            file = temp_dir / name
+            file.write_bytes(name.encode('UTF-8'))
+            files.append((file, return_perceptual_hash(30, phash, '0000000000000000')))
+
+        write_files_to_database(files)
+
+        index = get_phash_index()
+        self.assertEqual(index.search(hex_to_hash('f0f0f0f0f0f0f0f0'), 1), [(0, 'dupe_a.mp4'), (1, 'dupe_b.mp4')])
+        self.assertIn(['dupe_a.mp4', 'dupe_b.mp4'], index.duplicates(1))
+
+        with tempfile.TemporaryDirectory(prefix='test') as tmpdir:
+            config_file = Path(tmpdir) / 'namer.cfg'
+            config_file.write_text('[namer]\nuse_database = True\n')
+            dupes_main(['-c', str(config_file), '-d', '1'])
+
+        self.assertIn('dupe_a.mp4\ndupe_b.mp4\n', mock_stdout.getvalue())
+        self.assertNotIn('other.mp4', mock_stdout.getvalue())
+
+    def test_write_behind(self):
+        """
+        Test queued writes are merged per file, and written together when a queued file is searched for, or when flushed.
+        """
+        temp_dir = self.__old_file.parent
+        files = []
+        for name in ['queued_a.mp4', 'queued_b.mp4']:
+            file = temp_dir / name
+            file.write_bytes(name.encode('UTF-8'))
+            files.append(file)
+
+        def count_rows() -> int:
+            with closing(sqlite3.connect(temp_dir / 'namer_database.sqlite')) as connection:
+                self.assertEqual(connection.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+                return connection.execute('SELECT COUNT(*) FROM "File" WHERE "file_name" LIKE \'queued_%\'').fetchone()[0]
+
+        write_file_to_database(files[0], return_perceptual_hash(10, 'a0a0a0a0a0a0a0a0', '0000000000000001'))
+        write_ffprobe_to_database(files[0], '{}')
+        write_file_to_database(files[1], return_perceptual_hash(20, 'b0b0b0b0b0b0b0b0', '0000000000000002'))
+        self.assertEqual(count_rows(), 0)
+
+        found = search_file_in_database(files[0])
+        self.assertEqual(count_rows(), 2)
+        self.assertIsNotNone(found)
+        if found:
+            self.assertEqual((found.duration, found.phash, found.ffprobe), (10, 'a0a0a0a0a0a0a0a0', '{}'))
+
+        write_ffprobe_to_database(files[1], '{"streams": []}')
+        flush_database()
+        self.assertEqual(get_ffprobe_from_database(files[1]), '{"streams": []}')
+        self.assertEqual(count_rows(), 2)
+
+    def test_write_behind_flushes_on_size_and_time(self):
+        """
+        Test the write-behind thread writes once enough files are queued, or once the oldest queued file waited long enough.
+        """
+        file, other_file = self.__old_file.parent / 'behind.mp4', self.__old_file.parent / 'other_behind.mp4'
+        file.write_bytes(b'behind')
+        other_file.write_bytes(b'other')
+
+        written = []
+        write_behind = WriteBehind(lambda items: written.append(sorted(name for name, _, _ in items)), max_size=2, max_delay=0.5)
+        write_behind.put(file, duration=1)
+        write_behind.put(file, phash='a')
+        Wait().seconds(2).checking(0.05).until(lambda: len(written) > 0).is_true()
+        self.assertEqual(written, [['behind.mp4']])
+
+        write_behind.put(file, duration=1)
+        write_behind.put(other_file, duration=2)
+        Wait().seconds(2).checking(0.05).until(lambda: len(written) > 1).is_true()
+        self.assertEqual(written[1], ['behind.mp4', 'other_behind.mp4'])
+
+    def test_migration_removes_duplicate_files(self):
+        """
+        Test duplicate rows of a file are merged before its device and inode are made unique, and indexes are added.
+        """
+        with tempfile.TemporaryDirectory(prefix='test') as tmpdir:
+            db_file = Path(tmpdir) / 'namer_database.sqlite'
+            with closing(sqlite3.connect(db_file)) as connection, connection:
+                connection.execute('CREATE TABLE "File" ("id" INTEGER PRIMARY KEY AUTOINCREMENT, "file_name" TEXT NOT NULL, "file_size" INTEGER NOT NULL, "file_time" REAL NOT NULL, "file_device" INTEGER, "file_inode" INTEGER, "duration" INTEGER, "phash" TEXT, "oshash" TEXT, "ffprobe" TEXT)')
+                connection.execute('CREATE INDEX "idx_file__file_device_file_inode" ON "File" ("file_device", "file_inode")')
+                rows = [
+                    ('a.mp4', 10, 1.0, 1, 1, 30, 'aaaaaaaaaaaaaaaa', 'a1', None),
+                    ('a.mp4', 10, 1.0, 1, 1, None, None, None, '{}'),
+                    ('b.mp4', 20, 2.0, 1, 2, 40, 'bbbbbbbbbbbbbbbb', 'b1', None),
+                    ('b.mp4', 21, 3.0, 1, 2, None, None, None, '{"streams": []}'),
+                    ('old.mp4', 30, 3.0, None, None, 50, 'cccccccccccccccc', 'c1', None),
+                    ('old.mp4', 30, 3.0, None, None, 50, 'cccccccccccccccc', 'c1', None),
+                ]
+                connection.executemany('INSERT INTO "File" ("file_name", "file_size", "file_time", "file_device", "file_inode", "duration", "phash", "oshash", "ffprobe") VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+            migrate_database(db_file)
+            migrate_database(db_file)
+
+            with closing(sqlite3.connect(db_file)) as connection:
+                files = connection.execute('SELECT "file_name", "file_size", "duration", "phash", "ffprobe" FROM "File" ORDER BY "id"').fetchall()
+                self.assertEqual(files, [('a.mp4', 10, 30, 'aaaaaaaaaaaaaaaa', '{}'), ('b.mp4', 21, None, None, '{"streams": []}'), ('old.mp4', 30, 50, 'cccccccccccccccc', None), ('old.mp4', 30, 50, 'cccccccccccccccc', None)])
+
+                indexes = {row[1]: row[2] for row in connection.execute('PRAGMA index_list("File")')}
+                self.assertEqual(indexes, {'unq_file__file_device_file_inode': 1, 'idx_file__file_name_file_size': 0, 'idx_file__phash': 0, 'idx_file__oshash': 0})
+
+                with self.assertRaises(sqlite3.IntegrityError):
+                    connection.execute('INSERT INTO "File" ("file_name", "file_size", "file_time", "file_device", "file_inode") VALUES (\'c.mp4\', 1, 1.0, 1, 1)')
+
+    def test_changed_file_replaces_its_row(self):
+        """
+        Test writing a file that changed since it was stored updates its row, dropping values of the older version.
+        """
+        file = self.__old_file.parent / 'changed.mp4'
+        file.write_bytes(b'first version')
+        write_files_to_database([(file, return_perceptual_hash(10, 'd0d0d0d0d0d0d0d0', '0000000000000003'))])
+        write_ffprobe_to_database(file, '{}')
+        flush_database()
+
+        file.write_bytes(b'second, longer, version')
+        write_files_to_database([(file, return_perceptual_hash(20, 'e0e0e0e0e0e0e0e0', '0000000000000004'))])
+
+        with closing(sqlite3.connect(file.parent / 'namer_database.sqlite')) as connection:
+            rows = connection.execute('SELECT "file_size", "duration", "phash", "ffprobe" FROM "File" WHERE "file_inode" = ?', (file.stat().st_ino,)).fetchall()
+            self.assertEqual(rows, [(file.stat().st_size, 20, 'e0e0e0e0e0e0e0e0', '')])
+
+
+    def test_queued_commands_resume_after_restart(self):
+        """
+        Test commands recorded in the work queue when namer stopped are resumed, and unfinished moves rolled back.
+        """
+        config = utils.sample_config()
+        config.min_file_size = 0
+        with utils.environment(config) as (temp_dir, fake_tpdb, config):
+            processing = utils.new_ea(config.work_dir, use_dir=False).get_file()
+            write_queued_command(processing, config.watch_dir / processing.name, QueueStage.PROCESSING)
+            moving = utils.new_dorcel(config.watch_dir, use_dir=False).get_file()
+            write_queued_command(config.work_dir / moving.name, moving, QueueStage.MOVING)
+            self.assertEqual(len(get_queued_commands(config.work_dir)), 2)
+
+            with create_watcher(config) as watcher:
+                Wait().seconds(60).checking(1).until(lambda: any(config.watch_dir.iterdir()) or any(config.work_dir.iterdir())).is_false()
+                watcher.stop()
+
+            output_file = config.dest_dir / 'Evil Angel' / 'Evil Angel - 2022-01-03 - Carmela Clutch Fabulous Anal 3-Way! [WEBDL-240].mp4'
+            self.assertTrue(output_file.exists())
+            self.assertEqual(len(list(config.dest_dir.rglob('*.mp4'))), 2)
+            self.assertEqual(get_queued_commands(config.work_dir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
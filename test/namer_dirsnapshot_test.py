@@ -0,0 +1,104 @@
+"""
+Test dirsnapshot.py
+"""
+
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from loguru import logger
+
+from namer.dirsnapshot import DirSnapshot
+from test import utils
+
+
+class UnitTestAsTheDefaultExecution(unittest.TestCase):
+    """
+    Always test first.
+    """
+
+    def __init__(self, method_name='runTest'):
+        super().__init__(method_name)
+
+        if not utils.is_debugging():
+            logger.remove()
+
+    @staticmethod
+    def __make_tree(root: Path):
+        for sub_dir in ['a', 'b', 'b/c']:
+            (root / sub_dir).mkdir(parents=True)
+            (root / sub_dir / 'movie.mp4').write_bytes(b'movie')
+
+        # make the listings old enough to be trusted.
+        old = time.time() - 60
+        for directory in [root, root / 'a', root / 'b', root / 'b/c']:
+            os.utime(directory, (old, old))
+
+    def test_unchanged_dirs_are_not_listed(self):
+        """
+        Test a second scan only lists changed directories, and only stats directories and files in changed ones.
+        """
+        with tempfile.TemporaryDirectory(prefix='test') as tmpdir:
+            root = Path(tmpdir)
+            self.__make_tree(root)
+            snapshot = DirSnapshot(root)
+            first = snapshot.snapshot()
+            self.assertEqual(len(first.paths), 7)
+
+            (root / 'b' / 'new.mp4').write_bytes(b'new')
+            with mock.patch('os.scandir', wraps=os.scandir) as scandir, mock.patch('os.stat', wraps=os.stat) as stat:
+                second = snapshot.snapshot()
+
+            self.assertEqual(second.paths - first.paths, {str(root / 'b' / 'new.mp4')})
+            self.assertEqual([call.args[0] for call in scandir.call_args_list], [str(root / 'b')])
+            stated = {call.args[0] for call in stat.call_args_list}
+            self.assertEqual(stated, {str(root), str(root / 'a'), str(root / 'b'), str(root / 'b/c'), str(root / 'b/movie.mp4'), str(root / 'b/new.mp4')})
+
+    def test_deleted_files_are_forgotten(self):
+        """
+        Test files removed from a directory are no longer in the snapshot.
+        """
+        with tempfile.TemporaryDirectory(prefix='test') as tmpdir:
+            root = Path(tmpdir)
+            self.__make_tree(root)
+            snapshot = DirSnapshot(root)
+            snapshot.snapshot()
+
+            (root / 'a' / 'movie.mp4').unlink()
+            self.assertNotIn(str(root / 'a' / 'movie.mp4'), snapshot.snapshot().paths)
+
+    def test_save_and_load(self):
+        """
+        Test a loaded snapshot does not list unchanged directories, and a snapshot of another root is ignored.
+        """
+        with tempfile.TemporaryDirectory(prefix='test') as tmpdir:
+            root = Path(tmpdir) / 'watch'
+            self.__make_tree(root)
+            snapshot_file = Path(tmpdir) / 'db' / 'snapshot.json'
+            snapshot = DirSnapshot(root)
+            paths = snapshot.snapshot().paths
+            snapshot.save(snapshot_file)
+
+            loaded = DirSnapshot(root)
+            loaded.load(snapshot_file)
+            with mock.patch('os.scandir', wraps=os.scandir) as scandir:
+                loaded_paths = loaded.snapshot().paths
+
+            self.assertEqual(loaded_paths, paths)
+            scandir.assert_not_called()
+            movie = str(root / 'a' / 'movie.mp4')
+            self.assertEqual(loaded.stat(movie).st_mtime, os.stat(movie).st_mtime)
+
+            other = DirSnapshot(root / 'a')
+            other.load(snapshot_file)
+            with mock.patch('os.scandir', wraps=os.scandir) as scandir:
+                other.snapshot()
+
+            scandir.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
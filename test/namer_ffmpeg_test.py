@@ -6,6 +6,7 @@ import shutil
 import tempfile
 import unittest
 from pathlib import Path
+from unittest.mock import patch
 
 from loguru import logger
 
@@ -91,10 +92,50 @@ class UnitTestAsTheDefaultExecution(unittest.TestCase):
             self.assertEqual(stream_number, -1)
             stream_number = FFMpeg().get_audio_stream_for_lang(file, 'eng')
             self.assertEqual(stream_number, 1)
-            FFMpeg().update_audio_stream_if_needed(file, 'eng')
+            stat = file.stat()
+            self.assertTrue(FFMpeg().update_audio_stream_if_needed(file, 'eng'))
+
+            # edited in place, not replaced by a copy.
+            self.assertEqual((file.stat().st_ino, file.stat().st_size), (stat.st_ino, stat.st_size))
+            stream_number = FFMpeg().get_audio_stream_for_lang(file, 'eng')
+            self.assertEqual(stream_number, -1)
+            results = FFMpeg().ffprobe(file)
+            self.assertIsNotNone(results)
+            if results:
+                self.assertEqual([stream.disposition_default for stream in results.get_all_streams()], [True, False, True])
+
+    def test_update_audio_stream_with_ffmpeg(self):
+        """
+        Verifies ffmpeg copies the file to change its default audio stream if it can not be edited in place.
+        """
+        with tempfile.TemporaryDirectory(prefix='test') as tmpdir:
+            temp_dir = Path(tmpdir)
+            shutil.copytree(Path(__file__).resolve().parent, temp_dir / 'test')
+            file = temp_dir / 'test' / 'Site.22.01.01.painful.pun.XXX.720p.xpost_wrong.mp4'
+            with patch('namer.ffmpeg.set_default_track', return_value=False):
+                self.assertTrue(FFMpeg().update_audio_stream_if_needed(file, 'eng'))
+
             stream_number = FFMpeg().get_audio_stream_for_lang(file, 'eng')
             self.assertEqual(stream_number, -1)
 
+    def test_extract_screenshot_raw(self):
+        """
+        Verifies raw frames are the same as the decoded apng frames.
+        """
+        with tempfile.TemporaryDirectory(prefix='test') as tmpdir:
+            temp_dir = Path(tmpdir)
+            shutil.copytree(Path(__file__).resolve().parent, temp_dir / 'test')
+            file = temp_dir / 'test' / 'Site.22.01.01.painful.pun.XXX.720p.xpost.mp4'
+            ffmpeg = FFMpeg()
+            for time in [1.5, 20.1]:
+                expected = ffmpeg.extract_screenshot(file, time, 160)
+                image = ffmpeg.extract_screenshot(file, time, 160, raw=True)
+                self.assertEqual(image.size, expected.size)
+                self.assertEqual(image.tobytes(), expected.convert('RGB').tobytes())
+
+            screenshots = ffmpeg.extract_screenshots(file, [1.5, 20.1], 160)
+            self.assertEqual([screenshot.tobytes() for screenshot in screenshots], [ffmpeg.extract_screenshot(file, time, 160, raw=True).tobytes() for time in [1.5, 20.1]])
+
     def test_file_ffmpeg(self):
         versions = FFMpeg().ffmpeg_version()
         for _, version in versions.items():
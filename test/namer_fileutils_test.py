@@ -5,6 +5,7 @@ Tests for namer_file_parser.py
 import io
 import shutil
 import tempfile
+import time
 import unittest
 from pathlib import Path
 from platform import system
@@ -12,7 +13,7 @@ from unittest.mock import patch
 
 from loguru import logger
 
-from namer.command import main, set_permissions
+from namer.command import Command, CommandQueue, main, set_permissions
 from test import utils
 from test.utils import environment, sample_config
 
@@ -68,5 +69,94 @@ class UnitTestAsTheDefaultExecution(unittest.TestCase):
                 self.assertEqual(oct(target_dir.stat().st_mode)[-3:], '777')
 
 
+    def test_command_queue_deduplicates_targets(self):
+        """
+        Test queued targets are not queued twice, and can be queued again once taken from the queue.
+        """
+        config = sample_config()
+
+        def command(file: Path) -> Command:
+            new_command = Command()
+            new_command.target_movie_file = file
+            new_command.config = config
+            return new_command
+
+        with tempfile.TemporaryDirectory(prefix='test') as tmpdir:
+            temp_dir = Path(tmpdir)
+            queue = CommandQueue()
+            for idx in range(10000):
+                self.assertTrue(queue.put_unique(command(temp_dir / f'movie{idx}.mp4')))
+
+            movie = command(temp_dir / 'movie0.mp4')
+            self.assertTrue(queue.is_queued(movie))
+            self.assertFalse(queue.put_unique(movie))
+            self.assertEqual(queue.qsize(), 10000)
+
+            queue.put(None)
+            first = queue.get()
+            self.assertEqual(first.target_movie_file, movie.target_movie_file)
+            self.assertFalse(queue.is_queued(movie))
+            self.assertTrue(queue.put_unique(movie))
+            self.assertEqual(queue.qsize(), 10001)
+
+
+    def test_command_queue_priority(self):
+        """
+        Test web ui commands and small files are processed first, large files age, and None stops workers last.
+        """
+        config = sample_config()
+
+        def command(file: Path, size: int, is_auto: bool = True) -> Command:
+            with open(file, 'wb') as sized:
+                sized.truncate(size)
+
+            new_command = Command()
+            new_command.target_movie_file = file
+            new_command.is_auto = is_auto
+            new_command.config = config
+            return new_command
+
+        with tempfile.TemporaryDirectory(prefix='test') as tmpdir:
+            temp_dir = Path(tmpdir)
+            gb = 1024 * 1024 * 1024
+            queue = CommandQueue()
+            now = time.time()
+            with patch('time.time', return_value=now - 2 * CommandQueue.max_size_delay):
+                queue.put(command(temp_dir / 'old_large.mp4', 20 * gb))
+
+            with patch('time.time', return_value=now):
+                queue.put(command(temp_dir / 'large.mp4', 2 * gb))
+                queue.put(None)
+                queue.put(command(temp_dir / 'small.mp4', 1024))
+                queue.put(command(temp_dir / 'manual.mp4', 20 * gb, is_auto=False))
+
+            names = [queued.target_movie_file.name for queued, _ in queue.items()]
+            self.assertEqual(names, ['manual.mp4', 'old_large.mp4', 'small.mp4', 'large.mp4'])
+            self.assertEqual([queue.get().target_movie_file.name for _ in range(4)], names)
+            self.assertIsNone(queue.get())
+
+    def test_command_queue_estimated_wait(self):
+        """
+        Test the estimated wait grows with the position in the queue, once a command was processed.
+        """
+        config = sample_config()
+        with tempfile.TemporaryDirectory(prefix='test') as tmpdir:
+            queue = CommandQueue()
+            for idx in range(4):
+                new_command = Command()
+                new_command.target_movie_file = Path(tmpdir) / f'movie{idx}.mp4'
+                new_command.config = config
+                queue.put(new_command)
+
+            self.assertEqual([wait for _, wait in queue.items()], [None, None, None, None])
+            queue.get()
+            time.sleep(0.1)
+            queue.task_done()
+            waits = [wait for _, wait in queue.items()]
+            self.assertEqual(len(waits), 3)
+            self.assertGreaterEqual(waits[0], 0.1)
+            self.assertAlmostEqual(waits[2], 3 * waits[0])
+
+
 if __name__ == '__main__':
     unittest.main()
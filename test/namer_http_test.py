@@ -0,0 +1,163 @@
+"""
+Test namer_http_test.py
+"""
+
+import tempfile
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from threading import Thread
+
+from loguru import logger
+
+from namer.http import Http
+from test import utils
+
+
+class CountingHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):  # noqa: N802
+        server = self.server
+        server.requests += 1  # type: ignore
+        status = 503 if server.requests <= server.failures else 200  # type: ignore
+        body = server.body  # type: ignore
+        requested_range = self.headers.get('Range')
+        server.ranges.append(requested_range)  # type: ignore
+        content_range = None
+        if status == 200 and requested_range and server.supports_ranges:  # type: ignore
+            start = int(requested_range.removeprefix('bytes=').removesuffix('-'))
+            if start >= len(body):
+                status, body = 416, b''
+            else:
+                status, content_range, body = 206, f'bytes {start}-{len(body) - 1}/{len(body)}', body[start:]
+
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        if content_range:
+            self.send_header('Content-Range', content_range)
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = do_GET  # noqa: N815
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1  # type: ignore
+
+    def log_message(self, format, *args):  # noqa: A002
+        pass
+
+
+class UnitTestAsTheDefaultExecution(unittest.TestCase):
+    """
+    Always test first.
+    """
+
+    def __init__(self, method_name='runTest'):
+        super().__init__(method_name)
+
+        if not utils.is_debugging():
+            logger.remove()
+
+    def __serve(self, failures: int = 0, body: bytes = b'hello', supports_ranges: bool = True) -> ThreadingHTTPServer:
+        server = ThreadingHTTPServer(('127.0.0.1', 0), CountingHandler)
+        server.requests, server.connections, server.failures = 0, 0, failures  # type: ignore
+        server.body, server.supports_ranges, server.ranges = body, supports_ranges, []  # type: ignore
+        Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.addCleanup(Http.configure)
+        return server
+
+    def test_connections_are_reused(self):
+        """
+        Test requests, streamed or not, share kept alive connections.
+        """
+        server = self.__serve()
+        Http.configure(pool_size=2, max_retries=0)
+        url = f'http://127.0.0.1:{server.server_port}/file'
+        for _ in range(3):
+            self.assertEqual(Http.get(url).text, 'hello')
+
+            file = Http.download_file(url)
+            self.assertIsNotNone(file)
+            if file:
+                self.assertEqual(file.getvalue(), b'hello')
+
+        self.assertEqual(server.requests, 6)  # type: ignore
+        self.assertEqual(server.connections, 1)  # type: ignore
+
+    def test_retry_server_errors(self):
+        """
+        Test requests failing with a 5xx status are retried.
+        """
+        server = self.__serve(failures=2)
+        Http.configure(pool_size=2, max_retries=3, backoff_factor=0)
+        response = Http.get(f'http://127.0.0.1:{server.server_port}/file')
+        self.assertTrue(response.ok)
+        self.assertEqual(server.requests, 3)  # type: ignore
+
+        server = self.__serve(failures=5)
+        Http.configure(pool_size=2, max_retries=1, backoff_factor=0)
+        response = Http.get(f'http://127.0.0.1:{server.server_port}/file')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(server.requests, 2)  # type: ignore
+
+    def test_no_retry_post_server_errors(self):
+        """
+        Test posts failing with a 5xx status are not retried, they may have been acted on.
+        """
+        server = self.__serve(failures=5)
+        Http.configure(pool_size=2, max_retries=3, backoff_factor=0)
+        response = Http.post(f'http://127.0.0.1:{server.server_port}/file', data=b'{}')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(server.requests, 1)  # type: ignore
+
+
+    def test_download_to_file(self):
+        """
+        Test downloads are streamed to a part file, which is renamed once complete.
+        """
+        body = bytes(range(256)) * 10000
+        server = self.__serve(body=body)
+        with tempfile.TemporaryDirectory(prefix='test') as tmp_dir:
+            file = Path(tmp_dir) / 'trailer.mp4'
+            self.assertTrue(Http.download_to_file(f'http://127.0.0.1:{server.server_port}/file', file))
+            self.assertEqual(file.read_bytes(), body)
+            self.assertEqual(list(Path(tmp_dir).iterdir()), [file])
+            self.assertEqual(server.ranges, [None])  # type: ignore
+
+            Http.configure(max_retries=0)
+            server.failures = server.requests + 1  # type: ignore
+            failed = Path(tmp_dir) / 'failed.mp4'
+            self.assertFalse(Http.download_to_file(f'http://127.0.0.1:{server.server_port}/file', failed))
+            self.assertFalse(failed.exists())
+
+    def test_download_to_file_resume(self):
+        """
+        Test an interrupted download resumes from its part file, or starts over should the server not support ranges.
+        """
+        body = bytes(range(256)) * 10000
+        for supports_ranges, expected_range in [(True, 'bytes=1000-'), (False, 'bytes=1000-')]:
+            server = self.__serve(body=body, supports_ranges=supports_ranges)
+            with tempfile.TemporaryDirectory(prefix='test') as tmp_dir:
+                file = Path(tmp_dir) / 'trailer.mp4'
+                (Path(tmp_dir) / 'trailer.mp4.part').write_bytes(body[:1000])
+                self.assertTrue(Http.download_to_file(f'http://127.0.0.1:{server.server_port}/file', file))
+                self.assertEqual(file.read_bytes(), body)
+                self.assertEqual(list(Path(tmp_dir).iterdir()), [file])
+                self.assertEqual(server.ranges, [expected_range])  # type: ignore
+
+        # a part file larger than what is served starts over.
+        server = self.__serve(body=body)
+        with tempfile.TemporaryDirectory(prefix='test') as tmp_dir:
+            file = Path(tmp_dir) / 'trailer.mp4'
+            (Path(tmp_dir) / 'trailer.mp4.part').write_bytes(body + body)
+            self.assertTrue(Http.download_to_file(f'http://127.0.0.1:{server.server_port}/file', file))
+            self.assertEqual(file.read_bytes(), body)
+            self.assertEqual(server.ranges, [f'bytes={len(body) * 2}-', None])  # type: ignore
+
+
+if __name__ == '__main__':
+    unittest.main()
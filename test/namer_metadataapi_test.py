@@ -11,6 +11,7 @@ from loguru import logger
 from namer.comparison_results import SceneType
 from namer.fileinfo import parse_file_name
 from namer.command import make_command
+from namer.http import Http
 from namer.metadataapi import main, match
 from test import utils
 from test.utils import environment, sample_config
@@ -117,6 +118,32 @@ class UnitTestAsTheDefaultExecution(unittest.TestCase):
             self.assertEqual(info.new_file_name('{year}', config), '2022')
             self.assertEqual(info.new_file_name('{network}', config), 'GammaEnterprises')
 
+    def test_call_metadataapi_net_concurrent_lookups(self):
+        """
+        Test concurrent porndb queries find the same results as querying one at a time.
+        """
+        with environment() as (_path, _parrot, config):
+            name = parse_file_name('EvilAngel.22.01.03.Carmela.Clutch.Fabulous.Anal.3-Way.XXX.mp4', sample_config())
+            config.max_lookup_workers = 1
+            sequential = match(name, config)
+            config.max_lookup_workers = 4
+            concurrent = match(name, config)
+            self.assertEqual([result.looked_up.uuid for result in concurrent.results], [result.looked_up.uuid for result in sequential.results])
+            self.assertEqual([result.name_match for result in concurrent.results], [result.name_match for result in sequential.results])
+            self.assertTrue(concurrent.results[0].is_match())
+
+    def test_call_metadataapi_net_stops_on_match(self):
+        """
+        Test later queries of the search, and movie queries, are not requested once a query matched.
+        """
+        with environment() as (_path, _parrot, config), mock.patch.object(Http, 'request', wraps=Http.request) as request:
+            name = parse_file_name('EvilAngel.22.01.03.Carmela.Clutch.Fabulous.Anal.3-Way.XXX.mp4', sample_config())
+            config.max_lookup_workers = 4
+            results = match(name, config)
+            self.assertTrue(results.results[0].is_match())
+            searches = [call.args[1] for call in request.call_args_list if 'parse=' in call.args[1]]
+            self.assertEqual(searches, [f'{config.override_tpdb_address}/scenes?parse=evilangel.2022-01-03.Carmela%20Clutch%20Fabulous%20Anal%203-Way&limit=25'])
+
     def test_call_metadataapi_net2(self):
         """
         Test parsing a stored response as a LookedUpFileInfo
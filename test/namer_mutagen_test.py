@@ -7,6 +7,8 @@ import tempfile
 import unittest
 from pathlib import Path
 import hashlib
+from typing import List
+from unittest.mock import patch
 
 from loguru import logger
 from mutagen.mp4 import MP4
@@ -115,6 +117,52 @@ class UnitTestAsTheDefaultExecution(unittest.TestCase):
         self.assertEqual(str(sha_1), str(sha_2))
         self.assertEqual(sha_1, expected_on_all_oses)
 
+    def test_tags_are_written_in_place(self):
+        """
+        Test the padding freed by smaller tags is kept, so updating the tags doesn't move the media data.
+        """
+        with environment() as (temp_dir, _parrot, config):
+            test_dir = Path(__file__).resolve().parent
+            target_file = temp_dir / 'EvilAngel.22.01.03.Carmela.Clutch.Fabulous.Anal.3-Way.XXX.mp4'
+            shutil.copy(test_dir / 'Site.22.01.01.painful.pun.XXX.720p.xpost.mp4', target_file)
+            name_parts = parse_file_name(target_file.name, config)
+            looked_up = match(name_parts, config).results[0].looked_up
+            ffprobe_results = FFMpeg().ffprobe(target_file)
+            description = looked_up.description
+            looked_up.description = 'long description ' * 4000
+            update_mp4_file(target_file, looked_up, None, ffprobe_results, NamerConfig())
+            size = target_file.stat().st_size
+
+            looked_up.description = description
+            update_mp4_file(target_file, looked_up, None, ffprobe_results, NamerConfig())
+            validate_mp4_tags(self, target_file)
+            self.assertEqual(target_file.stat().st_size, size)
+
+    def test_rewrite_reserves_padding(self):
+        """
+        Test a full rewrite of the media data is reported, and reserves padding used by the next, larger, tags.
+        """
+        messages: List[str] = []
+        handler = logger.add(messages.append, level='INFO', format='{message}')
+        with environment() as (temp_dir, _parrot, config), patch('namer.mutagen.CHEAP_REWRITE_SIZE', 0):
+            test_dir = Path(__file__).resolve().parent
+            target_file = temp_dir / 'EvilAngel.22.01.03.Carmela.Clutch.Fabulous.Anal.3-Way.XXX.mp4'
+            shutil.copy(test_dir / 'Site.22.01.01.painful.pun.XXX.720p.xpost.mp4', target_file)
+            name_parts = parse_file_name(target_file.name, config)
+            looked_up = match(name_parts, config).results[0].looked_up
+            ffprobe_results = FFMpeg().ffprobe(target_file)
+            update_mp4_file(target_file, looked_up, None, ffprobe_results, NamerConfig())
+            size = target_file.stat().st_size
+            rewrites = [message for message in messages if 'rewriting' in message]
+            self.assertEqual(len(rewrites), 1)
+
+            looked_up.description = f'{looked_up.description} ' * 10
+            update_mp4_file(target_file, looked_up, None, ffprobe_results, NamerConfig())
+            self.assertEqual(target_file.stat().st_size, size)
+            self.assertEqual(len([message for message in messages if 'rewriting' in message]), 1)
+
+        logger.remove(handler)
+
     def test_non_existent_poster(self):
         """
         Test writing metadata to an mp4, including tag information, which is only
@@ -0,0 +1,71 @@
+"""
+Test phashindex.py
+"""
+
+import random
+import unittest
+
+from loguru import logger
+
+from namer.videophash.imagehash import hex_to_hash, ImageHash
+from namer.videophash.phashindex import PhashIndex
+from test import utils
+
+
+class UnitTestAsTheDefaultExecution(unittest.TestCase):
+    """
+    Always test first.
+    """
+
+    def __init__(self, method_name='runTest'):
+        super().__init__(method_name)
+
+        if not utils.is_debugging():
+            logger.remove()
+
+    def test_search(self):
+        """
+        Test searching finds the hashes within a distance, closest first.
+        """
+        index: PhashIndex[str] = PhashIndex()
+        index.add(hex_to_hash('88982eebd3552d9c'), 'same')
+        index.add(hex_to_hash('88982eebd3552d9f'), 'two')
+        index.add(hex_to_hash('08982eebd3552d9d'), 'also two')
+        index.add(hex_to_hash('77982eebd3552d9c'), 'far')
+
+        self.assertEqual(index.search(hex_to_hash('88982eebd3552d9c'), 2), [(0, 'same'), (2, 'two'), (2, 'also two')])
+        self.assertEqual(index.search(hex_to_hash('88982eebd3552d9c'), 0), [(0, 'same')])
+        self.assertEqual(len(index), 4)
+
+        with self.assertRaises(ValueError):
+            index.add(hex_to_hash('88982eeb'), 'short')
+
+    def test_duplicates(self):
+        """
+        Test duplicates are grouped, including chains of near hashes, and match comparing every pair of hashes.
+        """
+        rng = random.Random(11)
+        values = [rng.getrandbits(64) for _ in range(2000)]
+        values += [values[3], values[3] ^ 0b1011, values[10] ^ (1 << 63) ^ 1, values[10] ^ (1 << 63) ^ 1 ^ (0b111 << 30)]
+
+        index: PhashIndex[int] = PhashIndex()
+        for idx, value in enumerate(values):
+            index.add(ImageHash(value), idx)
+
+        duplicates = index.duplicates(4)
+        self.assertIn([3, 2000, 2001], duplicates)
+        self.assertIn([10, 2002, 2003], duplicates)
+
+        expected = set()
+        for first in range(len(values)):
+            for second in range(first + 1, len(values)):
+                if (values[first] ^ values[second]).bit_count() <= 4:
+                    expected.add((first, second))
+
+        found = {(first, second) for group in duplicates for first in group for second in group if first < second}
+        self.assertTrue(expected.issubset(found))
+        self.assertEqual(index.duplicates(0), [[3, 2000]])
+
+
+if __name__ == '__main__':
+    unittest.main()
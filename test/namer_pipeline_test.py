@@ -0,0 +1,88 @@
+"""
+Test pipeline.py
+"""
+
+import unittest
+from threading import Event, Lock
+
+from loguru import logger
+
+from namer.pipeline import Pipeline
+from test import utils
+
+
+class UnitTestAsTheDefaultExecution(unittest.TestCase):
+    """
+    Always test first.
+    """
+
+    def __init__(self, method_name='runTest'):
+        super().__init__(method_name)
+
+        if not utils.is_debugging():
+            logger.remove()
+
+    def test_pipeline_passes_items_through_stages(self):
+        """
+        Test every item passes all stages, and dropped or failed items still complete.
+        """
+        completed = []
+        lock = Lock()
+
+        def complete(item):
+            with lock:
+                completed.append(item)
+
+        def fail(item):
+            if item['value'] == 3:
+                raise ValueError('failed stage')
+
+            return item
+
+        stages = [
+            ('add', lambda item: item | {'value': item['value'] + 1}),
+            ('drop', lambda item: None if item['value'] == 2 else item),
+            ('fail', fail),
+            ('last', lambda item: item | {'done': True}),
+        ]
+        pipeline = Pipeline(stages, workers=2, on_complete=complete)
+        pipeline.start()
+        for value in range(5):
+            pipeline.put({'value': value})
+
+        pipeline.stop()
+
+        self.assertEqual(len(completed), 5)
+        self.assertEqual(sorted(item['value'] for item in completed), [1, 2, 3, 4, 5])
+        self.assertFalse(any('done' in item for item in completed))
+
+    def test_pipeline_stages_overlap(self):
+        """
+        Test stages work on different items at the same time.
+        """
+        second_started = Event()
+        overlapped = []
+
+        def first(item):
+            if item == 1:
+                # the second stage works on item 0 while the first stage is busy with item 1.
+                overlapped.append(second_started.wait(10))
+
+            return item
+
+        def second(item):
+            second_started.set()
+            return item
+
+        pipeline = Pipeline([('first', first), ('second', second)])
+        pipeline.start()
+        for value in range(2):
+            pipeline.put(value)
+
+        pipeline.stop()
+
+        self.assertEqual(overlapped, [True])
+
+
+if __name__ == '__main__':
+    unittest.main()
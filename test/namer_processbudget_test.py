@@ -0,0 +1,97 @@
+"""
+Test processbudget.py
+"""
+
+import time
+import unittest
+from threading import Lock, Thread
+from typing import List
+
+from loguru import logger
+
+from namer.processbudget import ProcessBudget, ProcessKind
+from test import utils
+
+
+class UnitTestAsTheDefaultExecution(unittest.TestCase):
+    """
+    Always test first.
+    """
+
+    def __init__(self, method_name='runTest'):
+        super().__init__(method_name)
+
+        if not utils.is_debugging():
+            logger.remove()
+
+    def tearDown(self):
+        ProcessBudget.configure()
+
+    def test_budget_limits_weighted_processes(self):
+        """
+        Test processes only run while their weights fit in the budget, a process heavier than the budget runs alone,
+        and the time they waited is counted.
+        """
+        ProcessBudget.configure(4)
+        lock = Lock()
+        running: List[ProcessKind] = []
+        overlaps: List[List[ProcessKind]] = []
+
+        def run(kind: ProcessKind):
+            with ProcessBudget.run(kind):
+                with lock:
+                    running.append(kind)
+                    overlaps.append(list(running))
+
+                time.sleep(0.1)
+                with lock:
+                    running.remove(kind)
+
+        stats_before = ProcessBudget.stats()
+        kinds = [ProcessKind.SCREENSHOT] * 4 + [ProcessKind.PHASH] + [ProcessKind.PROBE] * 4
+        threads = [Thread(target=run, args=(kind,)) for kind in kinds]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.01)
+
+        for thread in threads:
+            thread.join()
+
+        weights = {ProcessKind.SCREENSHOT: 2, ProcessKind.PHASH: 4, ProcessKind.PROBE: 1}
+        for overlap in overlaps:
+            self.assertLessEqual(sum(weights[kind] for kind in overlap), 4)
+            if ProcessKind.PHASH in overlap:
+                self.assertEqual(overlap, [ProcessKind.PHASH])
+
+        stats = ProcessBudget.stats()
+        screenshots = stats['screenshot']
+        self.assertEqual(screenshots['count'] - stats_before.get('screenshot', {}).get('count', 0), 4)
+        self.assertEqual(screenshots['running'], 0)
+        self.assertGreater(screenshots['max_wait_seconds'], 0.05)
+        self.assertGreater(stats['probe']['wait_seconds'], 0)
+
+    def test_processes_run_in_order(self):
+        """
+        Test a heavy process isn't starved by lighter ones asking after it.
+        """
+        ProcessBudget.configure(2)
+        order: List[str] = []
+
+        def run(name: str, kind: ProcessKind, seconds: float):
+            with ProcessBudget.run(kind):
+                order.append(name)
+                time.sleep(seconds)
+
+        threads = [Thread(target=run, args=('first', ProcessKind.PROBE, 0.2)), Thread(target=run, args=('heavy', ProcessKind.REMUX, 0)), Thread(target=run, args=('light', ProcessKind.PROBE, 0))]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.05)
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(order, ['first', 'heavy', 'light'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+"""
+Test settler.py
+"""
+
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from threading import Event
+from typing import List
+
+from loguru import logger
+
+from namer.settler import Settler
+from test import utils
+from test.utils import Wait
+
+
+class UnitTestAsTheDefaultExecution(unittest.TestCase):
+    """
+    Always test first.
+    """
+
+    def __init__(self, method_name='runTest'):
+        super().__init__(method_name)
+
+        if not utils.is_debugging():
+            logger.remove()
+
+    def test_growing_file_settles_once_unchanged(self):
+        """
+        Test a file is passed on only after it stopped growing, and add returns right away.
+        """
+        settled: List[Path] = []
+        settler = Settler(settled.append, interval=0.2)
+        settler.start()
+        with tempfile.TemporaryDirectory(prefix='test') as tmpdir:
+            file = Path(tmpdir) / 'movie.mp4'
+            file.write_bytes(b'0')
+            start = time.monotonic()
+            settler.add(file)
+            settler.add(file)
+            self.assertLess(time.monotonic() - start, 0.1)
+
+            for idx in range(5):
+                time.sleep(0.1)
+                with file.open('ab') as growing:
+                    growing.write(str(idx).encode())
+
+            self.assertEqual(settled, [])
+            Wait().seconds(5).checking(0.05).until(lambda: len(settled) > 0).is_true()
+            self.assertEqual(settled, [file])
+            self.assertEqual(settler.pending(), 0)
+
+        settler.stop()
+
+    def test_missing_file_is_dropped(self):
+        """
+        Test a file that disappears is never passed on.
+        """
+        settled: List[Path] = []
+        settler = Settler(settled.append, interval=0.1)
+        settler.start()
+        settler.add(Path(tempfile.gettempdir()) / 'does_not_exist.mp4')
+        Wait().seconds(5).checking(0.05).until(lambda: settler.pending() == 0).is_true()
+        settler.stop()
+        self.assertEqual(settled, [])
+
+    def test_busy_and_in_use_files_wait(self):
+        """
+        Test settled files wait while the settler is busy, or the file is in use.
+        """
+        settled: List[Path] = []
+        not_busy, not_in_use = Event(), Event()
+        settler = Settler(settled.append, interval=0.1, in_use=lambda _: not not_in_use.is_set(), is_busy=lambda: not not_busy.is_set(), busy_interval=0.1)
+        settler.start()
+        with tempfile.TemporaryDirectory(prefix='test') as tmpdir:
+            file = Path(tmpdir) / 'movie.mp4'
+            file.write_bytes(b'movie')
+            settler.add(file)
+            time.sleep(0.5)
+            not_in_use.set()
+            time.sleep(0.5)
+            self.assertEqual(settled, [])
+            not_busy.set()
+            Wait().seconds(5).checking(0.05).until(lambda: len(settled) > 0).is_true()
+
+        settler.stop()
+        self.assertEqual(settled, [file])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+"""
+Test videohashes.py
+"""
+
+import io
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import orjson
+from loguru import logger
+
+from namer.videohashes import main
+from test import utils
+
+
+class UnitTestAsTheDefaultExecution(unittest.TestCase):
+    """
+    Always test first.
+    """
+
+    def __init__(self, method_name='runTest'):
+        super().__init__(method_name)
+
+        if not utils.is_debugging():
+            logger.remove()
+
+    @mock.patch('sys.stdout', new_callable=io.StringIO)
+    def test_hash_dir(self, mock_stdout):
+        """
+        Test every movie in a directory tree is hashed by the process pool, and printed as json lines.
+        """
+        with tempfile.TemporaryDirectory(prefix='test') as tmpdir:
+            temp_dir = Path(tmpdir)
+            movie = Path(__file__).resolve().parent / 'Site.22.01.01.painful.pun.XXX.720p.xpost.mp4'
+            (temp_dir / 'movies' / 'nested').mkdir(parents=True)
+            shutil.copy(movie, temp_dir / 'movies' / 'one.mp4')
+            shutil.copy(movie, temp_dir / 'movies' / 'nested' / 'two.mp4')
+            (temp_dir / 'movies' / 'notes.txt').write_text('not a movie')
+
+            config_file = temp_dir / 'namer.cfg'
+            config_file.write_text('[namer]\nuse_database = False\n[Phash]\nuse_alt_phash_tool = True\n')
+            main(['-c', str(config_file), '-d', str(temp_dir / 'movies'), '--jobs', '2'])
+
+            results = [orjson.loads(line) for line in mock_stdout.getvalue().splitlines()]
+            self.assertEqual(sorted(Path(result['file']).name for result in results), ['one.mp4', 'two.mp4'])
+            for result in results:
+                self.assertEqual(result['phash'], '88982eebd3552d9c')
+                self.assertEqual(result['oshash'], 'ae547a6b1d8488bc')
+                self.assertEqual(result['duration'], 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
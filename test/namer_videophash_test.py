@@ -5,13 +5,18 @@ Test namer_videophash.py
 import shutil
 import tempfile
 import unittest
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from unittest import mock
 
+import jsonpickle
 from loguru import logger
 
+from namer.namer import calculate_phash
 from namer.videophash import imagehash
 from namer.videophash.videophashstash import StashVideoPerceptualHash
 from namer.videophash.videophash import VideoPerceptualHash
+from namer.videophash.videophashpool import _calculate_phash, get_process_pool_vph
 from test import utils
 from test.utils import sample_config
 
@@ -51,6 +56,55 @@ class UnitTestAsTheDefaultExecution(unittest.TestCase):
                 self.assertEqual(res.oshash, expected_oshash)
                 self.assertEqual(res.duration, expected_duration)
 
+    def test_get_phash_single_pass(self):
+        """
+        Test phash calculation with all thumbnails extracted by one ffmpeg process gives the same phash.
+        """
+        expected_phash = imagehash.hex_to_hash('88982eebd3552d9c')
+
+        with tempfile.TemporaryDirectory(prefix='test') as tmpdir:
+            temp_dir = Path(tmpdir)
+            shutil.copytree(Path(__file__).resolve().parent, temp_dir / 'test')
+            file = temp_dir / 'test' / 'Site.22.01.01.painful.pun.XXX.720p.xpost.mp4'
+            with mock.patch.object(self.config.ffmpeg, 'extract_screenshot') as extract_screenshot:
+                res = self.__generator.get_hashes(file, single_pass=True)
+                extract_screenshot.assert_not_called()
+
+            self.assertIsNotNone(res)
+            if res:
+                self.assertEqual(res.phash, expected_phash)
+                self.assertEqual(res.duration, 30)
+
+    def test_get_phash_process_pool(self):
+        """
+        Test phash calculation in a shared process pool gives the same hashes, with the ffmpeg workers split between processes.
+        """
+        expected_phash = imagehash.hex_to_hash('88982eebd3552d9c')
+
+        with tempfile.TemporaryDirectory(prefix='test') as tmpdir:
+            temp_dir = Path(tmpdir)
+            shutil.copytree(Path(__file__).resolve().parent, temp_dir / 'test')
+            file = temp_dir / 'test' / 'Site.22.01.01.painful.pun.XXX.720p.xpost.mp4'
+            config = sample_config()
+            config.use_database = False
+            config.use_alt_phash_tool = True
+            config.phash_processes = 2
+            config.max_ffmpeg_workers = 4
+            generator = get_process_pool_vph(config.ffmpeg, 2)
+            with mock.patch.object(ProcessPoolExecutor, 'submit', autospec=True, side_effect=ProcessPoolExecutor.submit) as submit:
+                res = calculate_phash(file, config)
+                self.assertEqual(calculate_phash(file, config), res)
+
+            self.assertIs(get_process_pool_vph(config.ffmpeg, 2), generator)
+            submit.assert_called_once()
+            self.assertEqual(submit.call_args.args[1:3], (_calculate_phash, file))
+            self.assertEqual(submit.call_args.args[4:], (2, False, False))
+            self.assertIsNotNone(res)
+            if res:
+                self.assertEqual(res.phash, expected_phash)
+                self.assertEqual(res.oshash, 'ae547a6b1d8488bc')
+                self.assertEqual(res.duration, 30)
+
     def test_get_stash_phash(self):
         """
         Test phash calculation.
@@ -71,6 +125,26 @@ class UnitTestAsTheDefaultExecution(unittest.TestCase):
                 self.assertEqual(res.oshash, expected_oshash)
                 self.assertEqual(res.duration, expected_duration)
 
+    def test_image_hash(self):
+        """
+        Test packed hashes round trip through hex, compare by hamming distance, and load from older namer logs.
+        """
+        phash = imagehash.hex_to_hash('88982eebd3552d9c')
+        self.assertEqual(str(phash), '88982eebd3552d9c')
+        self.assertEqual(len(phash), 64)
+        self.assertEqual(phash - imagehash.hex_to_hash('08982eebd3552d9d'), 2)
+        self.assertEqual(imagehash.ImageHash.from_array(phash.hash), phash)
+        self.assertEqual(str(imagehash.hex_to_hash('0000000000000001')), '0000000000000001')
+        with self.assertRaises(TypeError):
+            _ = phash - imagehash.hex_to_hash('88982eeb')
+
+        # hashes in logs written by older versions hold their bits as an array.
+        legacy = '{"py/object": "namer.videophash.imagehash.ImageHash", "hash": ' + jsonpickle.encode(phash.hash) + '}'
+        decoded = jsonpickle.decode(legacy)
+        self.assertIsInstance(decoded, imagehash.ImageHash)
+        self.assertEqual(decoded, phash)
+        self.assertEqual(jsonpickle.decode(jsonpickle.encode(phash)), phash)
+
 
 if __name__ == '__main__':
     unittest.main()
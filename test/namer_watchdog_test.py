@@ -3,17 +3,26 @@ Test namer_watchdog.py
 """
 
 import contextlib
+import errno
+import subprocess
+import sys
+import tempfile
 import time
+from threading import Barrier, BrokenBarrierError, Event, Lock, Thread
 from typing import Any
 import unittest
 from pathlib import Path
+from platform import system
+from unittest.mock import MagicMock, patch
 
 from loguru import logger
 from mutagen.mp4 import MP4
+from watchdog.observers.polling import PollingObserverVFS
 
+from namer.command import Command
 from namer.ffmpeg import FFMpeg
 from namer.configuration import NamerConfig
-from namer.watchdog import create_watcher, done_copying, retry_failed, MovieWatcher
+from namer.watchdog import create_watcher, done_copying, is_file_in_use, retry_failed, MovieWatcher, ObserverTestHandler
 from test import utils
 from test.utils import Wait, new_ea, new_dorcel, validate_mp4_tags, validate_permissions, environment, sample_config, ProcessingTarget
 
@@ -27,6 +36,21 @@ def wait_until_processed(watcher: MovieWatcher, duration: int = 60):
     watcher.stop()
 
 
+@contextlib.contextmanager
+def open_in_other_process(file: Path, mode: str):
+    """
+    Keeps file open in another process while in the context.
+    """
+    code = 'import sys; file = open(sys.argv[1], sys.argv[2]); print("open", flush=True); sys.stdin.read()'
+    with subprocess.Popen([sys.executable, '-c', code, str(file), mode], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True) as process:
+        assert process.stdout and process.stdout.readline().strip() == 'open'
+        try:
+            yield
+        finally:
+            if process.stdin:
+                process.stdin.close()
+
+
 @contextlib.contextmanager
 def make_watchdog_context(config: NamerConfig, targets=None):
     if targets is None:
@@ -53,6 +77,15 @@ def remove_performers(data: Any):
     single_scene['performers'] = []
 
 
+def fake_command(movie: Path, config: NamerConfig) -> Command:
+    command = Command()
+    command.input_file = movie
+    command.target_movie_file = movie
+    command.target_directory = None
+    command.config = config
+    return command
+
+
 class UnitTestAsTheDefaultExecution(unittest.TestCase):
     """
     Always test first.
@@ -72,6 +105,26 @@ class UnitTestAsTheDefaultExecution(unittest.TestCase):
         self.assertFalse(done_copying(non_path))
         self.assertFalse(done_copying(None))
 
+    @unittest.skipUnless(system() == 'Linux', 'leases and /proc are linux only')
+    def test_file_open_for_writing_is_in_use(self):
+        """
+        Test a file is in use while another process writes it, with a lease, or found in /proc when no lease can be taken.
+        """
+        with tempfile.TemporaryDirectory(prefix='test') as tmpdir:
+            file = Path(tmpdir) / 'movie.mp4'
+            file.write_bytes(b'movie')
+            self.assertFalse(is_file_in_use(file))
+            with open_in_other_process(file, 'rb'):
+                self.assertFalse(is_file_in_use(file))
+
+            with open_in_other_process(file, 'ab'):
+                self.assertTrue(is_file_in_use(file))
+                with patch('fcntl.fcntl', side_effect=OSError(errno.EACCES, 'no lease')):
+                    self.assertTrue(is_file_in_use(file))
+
+            with patch('fcntl.fcntl', side_effect=OSError(errno.EACCES, 'no lease')):
+                self.assertFalse(is_file_in_use(file))
+
     def test_handler_collisions_success(self):
         """
         Test the handle function works for a directory.
@@ -95,6 +148,133 @@ class UnitTestAsTheDefaultExecution(unittest.TestCase):
             self.assertEqual(len(list(config.failed_dir.iterdir())), 0)
             self.assertEqual(len(list(config.watch_dir.iterdir())), 0)
 
+    def test_workers_do_not_process_same_target_concurrently(self):
+        """
+        Test a target is not processed by a second worker while another worker processes it.
+        """
+        config = sample_config()
+        config.queue_workers = 2
+        started, release = Event(), Event()
+        lock = Lock()
+        active: set = set()
+        calls: list = []
+        overlaps: list = []
+
+        def fake_handle(command: Command):
+            target = command.get_command_target()
+            with lock:
+                if target in active:
+                    overlaps.append(target)
+                active.add(target)
+                calls.append(target)
+            started.set()
+            release.wait(10)
+            with lock:
+                active.discard(target)
+
+        with environment(config) as (_temp_dir, _fake_tpdb, config), patch('namer.watchdog.handle', side_effect=fake_handle):
+            watcher = MovieWatcher(config)
+            watcher.start()
+            movie = config.work_dir / 'movie.mp4'
+            watcher.enqueue_work(fake_command(movie, config))
+            self.assertTrue(started.wait(10))
+
+            # the second worker takes the command, and waits for the first one to finish the target.
+            watcher.enqueue_work(fake_command(movie, config))
+            time.sleep(0.5)
+            self.assertEqual(len(calls), 1)
+
+            release.set()
+            Wait().seconds(10).until(lambda: len(calls) == 2).is_true()
+            watcher.stop()
+            self.assertEqual(overlaps, [])
+
+    def test_workers_process_queue_concurrently(self):
+        """
+        Test all workers process queued commands at the same time, and stop cleanly.
+        """
+        config = sample_config()
+        config.queue_workers = 3
+        barrier = Barrier(config.queue_workers, timeout=10)
+        passed: list = []
+
+        def fake_handle(command: Command):
+            # only passes when all workers are processing a command at once.
+            with contextlib.suppress(BrokenBarrierError):
+                barrier.wait()
+                passed.append(command.get_command_target())
+
+        with environment(config) as (_temp_dir, _fake_tpdb, config), patch('namer.watchdog.handle', side_effect=fake_handle):
+            watcher = MovieWatcher(config)
+            watcher.start()
+            for idx in range(config.queue_workers):
+                watcher.enqueue_work(fake_command(config.work_dir / f'movie{idx}.mp4', config))
+
+            Wait().seconds(15).until(lambda: len(passed) == config.queue_workers).is_true()
+
+            stopper = Thread(target=watcher.stop)
+            stopper.start()
+            stopper.join(10)
+            self.assertFalse(stopper.is_alive())
+
+    def test_pipeline_failed_stage_releases_target(self):
+        """
+        Test a command failing in a pipeline stage is marked done, releases its target and moves nothing.
+        """
+        config = sample_config()
+        config.pipeline_processing = True
+        convert_and_hash = MagicMock(side_effect=ValueError('failed stage'))
+        move_and_tag = MagicMock(return_value=None)
+        with environment(config) as (_temp_dir, _fake_tpdb, config), patch('namer.watchdog.convert_and_hash', convert_and_hash), patch('namer.watchdog.move_and_tag', move_and_tag):
+            watcher = MovieWatcher(config)
+            command_queue = watcher._MovieWatcher__command_queue  # type: ignore
+            watcher.start()
+            movie = config.work_dir / 'movie.mp4'
+            for _ in range(2):
+                # the same target again is only processed once the first command released it.
+                watcher.enqueue_work(fake_command(movie, config))
+                Wait().seconds(10).until(lambda: command_queue.unfinished_tasks == 0).is_true()
+
+            watcher.stop()
+            self.assertEqual(convert_and_hash.call_count, 2)
+            move_and_tag.assert_not_called()
+            self.assertEqual(len(list(config.dest_dir.iterdir())), 0)
+
+    def test_pipeline_does_not_process_same_target_concurrently(self):
+        """
+        Test a target is not processed in the pipeline while an earlier command for it still is.
+        """
+        config = sample_config()
+        config.pipeline_processing = True
+        config.queue_workers = 2
+        started, release = Event(), Event()
+        calls: list = []
+
+        def fake_convert_and_hash(state):
+            calls.append(state.command.get_command_target())
+            started.set()
+            release.wait(10)
+            return state
+
+        with environment(config) as (_temp_dir, _fake_tpdb, config), patch('namer.watchdog.convert_and_hash', side_effect=fake_convert_and_hash), patch('namer.watchdog.lookup_metadata', side_effect=lambda state: state), patch('namer.watchdog.move_and_tag', return_value=None):
+            watcher = MovieWatcher(config)
+            command_queue = watcher._MovieWatcher__command_queue  # type: ignore
+            watcher.start()
+            movie = config.work_dir / 'movie.mp4'
+            watcher.enqueue_work(fake_command(movie, config))
+            self.assertTrue(started.wait(10))
+
+            # a free hash stage worker is available, but the target is still in the pipeline.
+            watcher.enqueue_work(fake_command(movie, config))
+            time.sleep(0.5)
+            self.assertEqual(len(calls), 1)
+            self.assertEqual(command_queue.unfinished_tasks, 2)
+
+            release.set()
+            Wait().seconds(10).until(lambda: command_queue.unfinished_tasks == 0).is_true()
+            watcher.stop()
+            self.assertEqual(len(calls), 2)
+
     def test_handler_collisions_success_choose_best(self):
         """
         Test the handle function works for a directory.
@@ -147,6 +327,38 @@ class UnitTestAsTheDefaultExecution(unittest.TestCase):
             self.assertEqual(len(list(config.failed_dir.iterdir())), 0)
             self.assertEqual(len(list(config.watch_dir.iterdir())), 0)
 
+    def test_native_observer_success(self):
+        """
+        Test files are processed when watched with file events.
+        """
+        config = sample_config()
+        config.min_file_size = 0
+        config.native_observer = True
+        with make_watchdog_context(config) as (temp_dir, watcher, fake_tpdb):
+            self.assertNotIsInstance(watcher._MovieWatcher__event_observer, PollingObserverVFS)  # type: ignore
+            targets = [new_ea(config.watch_dir)]
+            wait_until_processed(watcher)
+            self.assertFalse(targets[0].get_file().exists())
+            output_file = config.dest_dir / 'Evil Angel' / 'Evil Angel - 2022-01-03 - Carmela Clutch Fabulous Anal 3-Way! [WEBDL-240].mp4'
+            self.assertTrue(output_file.exists())
+            self.assertEqual(len(list(config.watch_dir.iterdir())), 0)
+
+    def test_native_observer_falls_back_to_polling(self):
+        """
+        Test the watch dir is polled if file events are not delivered.
+        """
+        config = sample_config()
+        config.min_file_size = 0
+        config.native_observer = True
+        with patch.object(ObserverTestHandler, 'on_any_event'), make_watchdog_context(config) as (temp_dir, watcher, fake_tpdb):
+            # the self test waits for an event for a few seconds.
+            Wait().seconds(10).checking(0.2).until(lambda: watcher._MovieWatcher__event_observer.is_alive()).is_true()  # type: ignore
+            self.assertIsInstance(watcher._MovieWatcher__event_observer, PollingObserverVFS)  # type: ignore
+            targets = [new_ea(config.watch_dir)]
+            wait_until_processed(watcher)
+            self.assertFalse(targets[0].get_file().exists())
+            self.assertEqual(len(list(config.watch_dir.iterdir())), 0)
+
     def test_event_listener_success_conversion(self):
         """
         Test the handle function works for a directory.
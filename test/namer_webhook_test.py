@@ -7,6 +7,7 @@ import unittest
 from pathlib import Path
 from unittest.mock import patch, MagicMock
 
+import requests
 from loguru import logger
 
 from namer.namer import send_webhook_notification
@@ -33,7 +34,7 @@ class WebhookTest(unittest.TestCase):
         config.webhook_enabled = False
         config.webhook_url = 'http://example.com/webhook'
 
-        with patch('requests.request') as mock_post:
+        with patch.object(requests.Session, 'request') as mock_post:
             send_webhook_notification(Path('/some/path/movie.mp4'), config)
             mock_post.assert_not_called()
 
@@ -45,7 +46,7 @@ class WebhookTest(unittest.TestCase):
         config.webhook_enabled = True
         config.webhook_url = ''
 
-        with patch('requests.request') as mock_post:
+        with patch.object(requests.Session, 'request') as mock_post:
             send_webhook_notification(Path('/some/path/movie.mp4'), config)
             mock_post.assert_not_called()
 
@@ -57,7 +58,7 @@ class WebhookTest(unittest.TestCase):
         config.webhook_enabled = True
         config.webhook_url = 'http://example.com/webhook'
 
-        with patch('requests.request') as mock_post:
+        with patch.object(requests.Session, 'request') as mock_post:
             mock_response = MagicMock()
             mock_response.raise_for_status.return_value = None
             mock_post.return_value = mock_response
@@ -79,7 +80,7 @@ class WebhookTest(unittest.TestCase):
         config.webhook_enabled = True
         config.webhook_url = 'http://example.com/webhook'
 
-        with patch('requests.request') as mock_post:
+        with patch.object(requests.Session, 'request') as mock_post:
             mock_post.side_effect = Exception('Connection error')
 
             # Should not raise an exception